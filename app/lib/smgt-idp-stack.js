@@ -3,12 +3,14 @@ const dynamodb = require('aws-cdk-lib/aws-dynamodb');
 const s3 = require('aws-cdk-lib/aws-s3');
 const s3deploy = require('aws-cdk-lib/aws-s3-deployment');
 const sns = require('aws-cdk-lib/aws-sns');
+const sqs = require('aws-cdk-lib/aws-sqs');
 const iam = require('aws-cdk-lib/aws-iam');
 const lambda = require('aws-cdk-lib/aws-lambda');
 const ssm = require('aws-cdk-lib/aws-ssm');
 const { Rule, Schedule } = require('aws-cdk-lib/aws-events');
 const {LambdaFunction} = require ('aws-cdk-lib/aws-events-targets');
 const { SnsEventSource } = require('aws-cdk-lib/aws-lambda-event-sources');
+const { SqsDestination } = require('aws-cdk-lib/aws-lambda-destinations');
 const path = require('path');
 
 class SMGTIdpStack extends Stack {
@@ -312,12 +314,26 @@ class SMGTIdpStack extends Stack {
                                         "dynamodb:PartiQLInsert",
                                         "dynamodb:PartiQLUpdate",
                                         "dynamodb:PartiQLDelete",
-                                        "dynamodb:PartiQLSelect"
+                                        "dynamodb:PartiQLSelect",
+                                        "dynamodb:PutItem",
+                                        "dynamodb:UpdateItem"
                                     ],
                                     resources: ["*"]
                                 })
                             ]
                           }),
+                          "idp-lambda-invoke-policy": new iam.PolicyDocument({
+                            statements: [
+                                new iam.PolicyStatement({
+                                    sid: "FanOutInvokeAccess",
+                                    effect: iam.Effect.ALLOW,
+                                    actions: [
+                                      "lambda:InvokeFunction"
+                                    ],
+                                    resources: [`arn:aws:lambda:${this.region}:${this.account}:function:idp-groundtruth-process-textract-output`]
+                                })
+                            ]
+                          }),
                           "idp-lambda-kms-policy": new iam.PolicyDocument({
                               statements:[
                                   new iam.PolicyStatement({
@@ -339,6 +355,21 @@ class SMGTIdpStack extends Stack {
                         }
                     });
 
+    /**
+     * Queue receiving the Textract notifications and fan-out page ranges the process output
+     * Lambda could not process after its retries, e.g. after a timeout, for inspection and redrive
+    */
+    const smgtProcessOutputFailures = new sqs.Queue(this, 'idp-groundtruth-process-textract-output-failures', {
+      encryption: sqs.QueueEncryption.SQS_MANAGED,
+      enforceSSL: true,
+      retentionPeriod: Duration.days(14)
+    });
+
+    new CfnOutput(this, 'process-textract-output-failures-queue', {
+      value: smgtProcessOutputFailures.queueUrl,
+      description: 'Amazon SQS queue of the Textract jobs and page ranges that failed processing'
+    });
+
     /**
      * Create Lambda that will consume message from topic and process the output from Textract
      * extracting the low confidence scores data that will be later used for the SMGT manifest message
@@ -354,14 +385,31 @@ class SMGTIdpStack extends Stack {
           LOG_LEVEL: 'DEBUG',
           GT_SNS_TOPIC_ARN: smgtManifestSNSTopic.topicArn,
           THRESHOLD_SSM: thresholdSSM.parameterName, 
+          THRESHOLD_CACHE_TTL: "300",          // optional, seconds the thresholds are cached between SSM reads
           TEXTRACT_GT_TABLE: smgtDynamoTable.tableName,
           TEXTRACT_OUTPUT_BKT: smgtsagemakerTextractOutputS3.bucketName,
           TEXTRACT_OUTPUT_PREFIX: "output",    // optional 
+          TEXTRACT_STREAM_OUTPUT: "false",     // optional, parse output parts incrementally
+          TEXTRACT_PREFETCH_PARTS: "2",        // optional, output parts downloaded ahead, 0 disables, spooled to /tmp when streaming
+          TEXTRACT_PREFETCH_SPOOL_MB: "8",     // optional, memory per prefetched part before it spills to /tmp
+          PAGE_RESULT_WRITE_POLICY: "flagged", // optional, flagged | all, all also writes the Textract results of pages not reviewed
+          PAGE_RENDITION_FORMAT: "none",       // optional, none | webp | jpeg web preview of each reviewed page, only once the reviewer UI reads renditionS3Uri
+          PAGE_RENDITION_MAX_DPI: "150",       // optional, resolution cap of the preview
+          PAGE_RENDITION_TILE_SIZE: "0",       // optional, preview tile size in pixels, 0 disables tiles
+          RECORD_WORKERS: "4",                 // optional, Textract jobs of one SNS event processed concurrently
+          REVIEW_MODE: "page",                 // optional, page | region, region reviews crops of the low confidence regions
+          FANOUT_PAGES_PER_WORKER: "0",        // optional, page range size per fan-out worker, 0 disables
+          FANOUT_CLAIM_LEASE_SECONDS: "900",   // optional, how long a worker holds its page range, at least the timeout
+          ALL_PAGES_COMPLETE_SNS_TOPIC_ARN: smgtIdpAllPagesReviewedSNS.topicArn,
           BUCKET_KMS_KEY: smgtsagemakerTextractOutputS3.encryptionKey?.keyId
       },
       role: lambdaRole,
       timeout: Duration.minutes(15),
-      memorySize: 512
+      memorySize: 512,
+      // fan-out workers re-claim their page range on retry once FANOUT_CLAIM_LEASE_SECONDS expired,
+      // invocations still failing after the retries are kept in the failures queue
+      retryAttempts: 2,
+      onFailure: new SqsDestination(smgtProcessOutputFailures)
     }); 
 
     /* Subscribe Lambda to SNS topic for events */
@@ -400,6 +448,7 @@ class SMGTIdpStack extends Stack {
       environment:{
           LOG_LEVEL: 'DEBUG',
           SMGT_DYNAMO_TABLE_NAME: smgtDynamoTable.tableName,
+          DELETE_RESULTS_ON_COMPLETE: "false",  // optional, delete per page Textract results once a job is reviewed
           ALL_PAGES_COMPLETE_SNS_TOPIC_ARN: smgtIdpAllPagesReviewedSNS.topicArn
       },
       role: lambdaRole,
@@ -0,0 +1,68 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+Micro-benchmark of the page manifest serialization, comparing the marshmallow
+schema round trip (tManifest.tManifest) with the direct writer (tManifest.toBytes)
+on a synthetic Textract page.
+
+Usage: python manifest_serialization.py [--blocks 5000] [--repeat 20] [--nulls]
+'''
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+from Manifests import tManifest
+
+
+def geometry(i: int) -> dict:
+    left, top = (i % 10) / 10, (i // 10 % 50) / 50
+    return {"BoundingBox": {"Width": 0.08, "Height": 0.015, "Left": left, "Top": top},
+            "Polygon": [{"X": left, "Y": top}, {"X": left + 0.08, "Y": top},
+                        {"X": left + 0.08, "Y": top + 0.015}, {"X": left, "Y": top + 0.015}]}
+
+
+def synthetic_page(block_count: int, nulls: bool) -> dict:
+    words = [{"BlockType": "WORD", "Confidence": 90 + i % 10, "Text": f"word{i}", "TextType": "PRINTED",
+              "Geometry": geometry(i), "Id": f"word-{i}", "Page": 1} for i in range(block_count - 1)]
+    if nulls:
+        # explicit nulls force the None removal, one block in a hundred has one
+        for word in words[::100]:
+            word["Query"] = None
+    page = {"BlockType": "PAGE", "Geometry": geometry(0), "Id": "page-1", "Page": 1,
+            "Relationships": [{"Type": "CHILD", "Ids": [word["Id"] for word in words]}]}
+    return {"AnalyzeDocumentModelVersion": "1.0", "DocumentMetadata": {"Pages": 1},
+            "JobStatus": "SUCCEEDED", "Blocks": [page] + words}
+
+
+def schema_path(data: dict) -> bytes:
+    manifest = tManifest(data)
+    manifest.add_blocks(data["Blocks"])
+    return json.dumps(manifest.tManifest).encode()
+
+
+def direct_path(data: dict) -> bytes:
+    manifest = tManifest(data)
+    manifest.add_blocks(data["Blocks"])
+    return manifest.toBytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--blocks', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--nulls', action='store_true', help='add explicit null values to some blocks')
+    args = parser.parse_args()
+
+    data = synthetic_page(args.blocks, args.nulls)
+    assert json.loads(schema_path(data)) == json.loads(direct_path(data)), "serializers disagree"
+
+    for name, func in [("marshmallow schema", schema_path), ("direct writer", direct_path)]:
+        best = min(timeit.repeat(lambda: func(data), number=1, repeat=args.repeat))
+        print(f"{name:<20} {best * 1000:8.2f} ms per page of {args.blocks} blocks")
+
+
+if __name__ == "__main__":
+    main()
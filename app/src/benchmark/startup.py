@@ -0,0 +1,132 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+Cold start benchmark of the Lambda handlers. Every sample runs in a fresh
+interpreter and measures the import of a handler module and, when an event is
+given, its first invocation. The deferred dependencies (pypdf, Pillow,
+marshmallow, trp) are timed on their own, that is what the first flagged page
+of a warm container pays.
+
+Run it inside the function image so the numbers match the Lambda runtime:
+
+  docker build -t idp-hitl app/src/lambda
+  docker run --rm --entrypoint python3 -v "$PWD/app/src/benchmark:/benchmark" \
+      idp-hitl /benchmark/startup.py --lambda-dir /var/task
+
+Usage: python startup.py [--lambda-dir ../lambda] [--repeat 5]
+                         [--event idp-hitl-post-annotation=event.json]
+                         [--save results.json] [--baseline results.json] [--tolerance 0.25]
+
+Handlers calling AWS are only invoked with an --event, against whatever account or
+endpoint (AWS_ENDPOINT_URL) the environment points to. With --baseline the run fails
+when a median import time grew by more than the tolerance.
+'''
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+DEFERRED_MODULES = ['pypdf', 'PIL.Image', 'marshmallow', 'trp']
+
+# Events of handlers that need no AWS access, invoked on every run
+DEFAULT_EVENTS = {
+    'idp-hitl-pre-annotation': {'dataObject': {'source-ref': 's3://bucket/prefix/pages/1/page/1.pdf'}},
+}
+
+PROBE = '''
+import importlib, json, sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+module = importlib.import_module(sys.argv[2])
+result = {"import_ms": (time.perf_counter() - start) * 1000}
+if len(sys.argv) > 3:
+    with open(sys.argv[3]) as event_file:
+        event = json.load(event_file)
+    start = time.perf_counter()
+    try:
+        module.lambda_handler(event, None)
+    except Exception as e:
+        result["error"] = repr(e)
+    result["invoke_ms"] = (time.perf_counter() - start) * 1000
+print(json.dumps(result))
+'''
+
+
+def probe(lambda_dir: str, module: str, event_path: str = None) -> dict:
+    args = [sys.executable, '-c', PROBE, lambda_dir, module] + ([event_path] if event_path else [])
+    env = dict(os.environ, LOG_LEVEL='ERROR')
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    output = subprocess.run(args, capture_output=True, text=True, env=env)
+    if output.returncode != 0:
+        return {'error': output.stderr.strip().splitlines()[-1]}
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def measure(lambda_dir: str, module: str, repeat: int, event_path: str = None) -> dict:
+    samples = [probe(lambda_dir, module, event_path) for _ in range(repeat)]
+    result = {'module': module}
+    for metric in ('import_ms', 'invoke_ms'):
+        values = [sample[metric] for sample in samples if metric in sample]
+        if values:
+            result[metric] = {'median': statistics.median(values), 'max': max(values)}
+    errors = {sample['error'] for sample in samples if 'error' in sample}
+    if errors:
+        result['errors'] = sorted(errors)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lambda-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--event', action='append', default=[], help='handler=path of an event to invoke the handler with')
+    parser.add_argument('--save', help='write the results as JSON')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare import times against')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+    lambda_dir = os.path.abspath(args.lambda_dir)
+
+    events = dict()
+    for handler, event in DEFAULT_EVENTS.items():
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as event_file:
+            json.dump(event, event_file)
+        events[handler] = event_file.name
+    for item in args.event:
+        handler, path = item.split('=', 1)
+        events[handler] = os.path.abspath(path)
+
+    handlers = sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(lambda_dir, 'idp-hitl-*.py')))
+    results = [measure(lambda_dir, handler, args.repeat, events.get(handler)) for handler in handlers]
+    results += [measure(lambda_dir, module, args.repeat) for module in DEFERRED_MODULES]
+
+    print(f"{'module':<32} {'import ms':>10} {'max':>8} {'1st invoke ms':>14} {'max':>8}")
+    for result in results:
+        row = f"{result['module']:<32}"
+        for metric in ('import_ms', 'invoke_ms'):
+            timing = result.get(metric)
+            row += f" {timing['median']:>10.1f} {timing['max']:>8.1f}" if timing else f" {'-':>10} {'-':>8}"
+        print(row + (f"  {'; '.join(result['errors'])}" if 'errors' in result else ''))
+
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(results, out, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = {result['module']: result for result in json.load(baseline_file)}
+        regressions = list()
+        for result in results:
+            before = baseline.get(result['module'], {}).get('import_ms')
+            if before and 'import_ms' in result and result['import_ms']['median'] > before['median'] * (1 + args.tolerance):
+                regressions.append(f"{result['module']}: {before['median']:.1f} -> {result['import_ms']['median']:.1f} ms")
+        if regressions:
+            print("Import time regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+Benchmark of single page extraction from a multi-page TIFF, comparing
+ - Pillow reopening the file and seeking to each page (the original extract_page)
+ - Pillow with one shared handle seeking forward through the flagged pages
+ - TiffIndex, one IFD walk then compressed strips copied through per page
+on a synthetic fax-like TIFF.
+
+Usage: python tiff_frames.py [--frames 1000] [--pages 100] [--compression group4]
+
+Generating the 1,000 frame file takes a few minutes, most of it Group 4 encoding.
+'''
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+from PIL import Image, ImageChops, ImageDraw
+from TiffFrames import TiffIndex
+
+
+def synthetic_tiff(path: str, frames: int, compression: str) -> None:
+    mode = '1' if compression == 'group4' else 'L'
+    pages = list()
+    for i in range(frames):
+        page = Image.new(mode, (1728, 2200), 1 if mode == '1' else 255)
+        draw = ImageDraw.Draw(page)
+        for line in range(40):
+            draw.text((100, 100 + line * 50), f"page {i + 1} line {line} " * 4, fill=0)
+        pages.append(page)
+    pages[0].save(path, save_all=True, append_images=pages[1:], compression=compression, dpi=(204, 196))
+
+
+def reopen_and_seek(path: str, page_nums: list) -> list:
+    results = list()
+    for page_num in page_nums:
+        with Image.open(path) as img:
+            img.seek(page_num - 1)
+            out = io.BytesIO()
+            img.save(out, format='TIFF')
+            results.append(out.getvalue())
+    return results
+
+
+def shared_handle(path: str, page_nums: list) -> list:
+    results = list()
+    with Image.open(path) as img:
+        for page_num in sorted(page_nums):
+            img.seek(page_num - 1)
+            out = io.BytesIO()
+            img.save(out, format='TIFF')
+            results.append(out.getvalue())
+    return results
+
+
+def tiff_index(path: str, page_nums: list) -> list:
+    index = TiffIndex(path)
+    try:
+        return [index.frame(page_num - 1) for page_num in page_nums]
+    finally:
+        index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--pages', type=int, default=100, help='number of flagged pages extracted, 0 for all')
+    parser.add_argument('--compression', default='group4', help='Pillow TIFF compression, e.g. group4, tiff_lzw, tiff_deflate')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'fax.tif')
+        synthetic_tiff(path, args.frames, args.compression)
+        page_nums = list(range(1, args.frames + 1))
+        if args.pages:
+            page_nums = sorted(random.Random(0).sample(page_nums, min(args.pages, args.frames)))
+        print(f"{args.frames} frame {args.compression} TIFF, {os.path.getsize(path) / 1e6:.1f} MB, extracting {len(page_nums)} pages")
+
+        sizes = dict()
+        for name, func in [("reopen and seek", reopen_and_seek), ("shared handle", shared_handle), ("TiffIndex", tiff_index)]:
+            start = time.perf_counter()
+            pages = func(path, page_nums)
+            elapsed = time.perf_counter() - start
+            sizes[name] = sum(map(len, pages))
+            print(f"{name:<16} {elapsed * 1000:10.1f} ms {elapsed * 1000 / len(page_nums):8.2f} ms per page {sizes[name] / 1e6:8.1f} MB written")
+
+        # the copied frames decode to the same pixels as Pillow's
+        with Image.open(path) as img:
+            for page_num, page in zip(page_nums[:5], tiff_index(path, page_nums[:5])):
+                img.seek(page_num - 1)
+                assert ImageChops.difference(Image.open(io.BytesIO(page)).convert('L'), img.convert('L')).getbbox() is None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import boto3
+import os
+import threading
+from botocore.config import Config
+
+'''
+Shared AWS client factory. Every service gets one client per
+Lambda container, created on first use with a common configuration so the
+thread pools of the handlers share a large enough connection pool
+'''
+
+# Connections kept per client, covers the upload, prefetch and publish thread pools running together
+_max_pool_connections = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 32))
+# Retry mode (legacy, standard or adaptive) and total attempts per request
+_retry_mode = os.environ.get('AWS_CLIENT_RETRY_MODE', 'adaptive')
+_max_attempts = int(os.environ.get('AWS_CLIENT_MAX_ATTEMPTS', 5))
+
+_config = Config(max_pool_connections=_max_pool_connections,
+                 retries={'mode': _retry_mode, 'total_max_attempts': _max_attempts},
+                 tcp_keepalive=True)
+_clients = dict()
+# client creation on the default session is not thread safe
+_lock = threading.Lock()
+
+def get_client(service: str):
+    client = _clients.get(service)
+    if client is None:
+        with _lock:
+            client = _clients.get(service)
+            if client is None:
+                client = _clients[service] = boto3.client(service, config=_config)
+    return client
@@ -0,0 +1,138 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import logging
+import operator
+from array import array
+from collections import Counter
+from itertools import compress
+
+logger = logging.getLogger(__name__)
+
+# Block types that are reviewed for low confidence scores
+REVIEW_BLOCK_TYPES = ["WORD", "TABLE", "CELL", "MERGED_CELL", "KEY_VALUE_SET", "SIGNATURE"]
+
+# Type codes, 0 is used for any block type not listed here
+BLOCK_TYPES = ["UNKNOWN", "PAGE", "LINE", "WORD", "TABLE", "CELL", "MERGED_CELL", "KEY_VALUE_SET",
+               "SELECTION_ELEMENT", "SIGNATURE", "QUERY", "QUERY_RESULT", "TABLE_TITLE", "TABLE_FOOTER",
+               "LAYOUT_TITLE", "LAYOUT_HEADER", "LAYOUT_FOOTER", "LAYOUT_SECTION_HEADER", "LAYOUT_PAGE_NUMBER",
+               "LAYOUT_LIST", "LAYOUT_FIGURE", "LAYOUT_TABLE", "LAYOUT_KEY_VALUE", "LAYOUT_TEXT"]
+BLOCK_CODES = {block_type: code for code, block_type in enumerate(BLOCK_TYPES)}
+
+# Blocks without a confidence score (PAGE) are never reported as low confidence
+NO_CONFIDENCE = 100.0
+
+def parse_thresholds(value: str) -> dict:
+    '''
+    Parses the confidence threshold parameter. It is either a single number applied
+    to all reviewed block types or a JSON object with a "default" and per block type
+    overrides, e.g. {"default": 80, "KEY_VALUE_SET": 90, "SIGNATURE": null}.
+    A null threshold turns off the review of that block type, other block types are rejected
+    '''
+    try:
+        config = json.loads(value)
+    except ValueError:
+        # plain numbers JSON doesn't accept, e.g. "80." or ".5"
+        config = float(value)
+    if not isinstance(config, dict):
+        return {block_type: float(config) for block_type in REVIEW_BLOCK_TYPES}
+    unknown = sorted(set(config) - set(REVIEW_BLOCK_TYPES) - {'default'})
+    if unknown:
+        raise ValueError(f"Unknown block types {unknown} in the confidence thresholds, expected default or one of {REVIEW_BLOCK_TYPES}")
+    default = config.get('default')
+    thresholds = {block_type: default for block_type in REVIEW_BLOCK_TYPES}
+    for block_type, threshold in config.items():
+        if block_type != 'default':
+            thresholds[block_type] = threshold
+    return {block_type: float(threshold) for block_type, threshold in thresholds.items() if threshold is not None}
+
+'''
+Columnar view of the blocks of a page. Block type codes, confidence scores
+and ids are held in flat arrays built in a single pass so
+threshold checks run over the arrays instead of the block dicts
+'''
+class BlockArrays:
+    def __init__(self, blocks: list):
+        codes = BLOCK_CODES
+        self.blocks = blocks
+        self.ids = ids = list()
+        self.types = types = array('B')
+        self.confidences = confidences = array('d')
+        for block in blocks:
+            ids.append(block.get('Id'))
+            types.append(codes.get(block.get('BlockType'), 0))
+            confidence = block.get('Confidence')
+            confidences.append(NO_CONFIDENCE if confidence is None else confidence)
+        # id to index map, only built when the text of child words is needed
+        self._positions = None
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    @staticmethod
+    def limits(thresholds: dict) -> array:
+        '''
+        Per type code threshold lookup table, types without a threshold are never below it
+        '''
+        table = array('d', [float('-inf')] * len(BLOCK_TYPES))
+        for block_type, threshold in thresholds.items():
+            if block_type in BLOCK_CODES and threshold is not None:
+                table[BLOCK_CODES[block_type]] = float(threshold)
+        return table
+
+    def low_confidence(self, thresholds: dict) -> list:
+        '''
+        Returns the indexes of all blocks scoring below the threshold of their type
+        '''
+        limits = self.limits(thresholds)
+        below = map(operator.lt, self.confidences, map(limits.__getitem__, self.types))
+        return list(compress(range(len(self.types)), below))
+
+    def count_by_type(self, indexes: list) -> dict:
+        return {BLOCK_TYPES[code]: count for code, count in Counter(map(self.types.__getitem__, indexes)).items()}
+
+    def min_by_type(self) -> dict:
+        minimums = dict()
+        for code, confidence in zip(self.types, self.confidences):
+            if confidence < minimums.get(code, NO_CONFIDENCE + 1):
+                minimums[code] = confidence
+        return {BLOCK_TYPES[code]: confidence for code, confidence in minimums.items()}
+
+    def text(self, index: int) -> str:
+        '''
+        Text of a block, for blocks without their own text (cells, form keys and values)
+        the text of their child words
+        '''
+        block = self.blocks[index]
+        if 'Text' in block:
+            return block['Text']
+        if self._positions is None:
+            self._positions = {block_id: position for position, block_id in enumerate(self.ids)}
+        words = list()
+        for rel in block.get('Relationships') or []:
+            if rel['Type'] == 'CHILD':
+                for child_id in rel['Ids']:
+                    child = self._positions.get(child_id)
+                    if child is not None and self.types[child] == BLOCK_CODES['WORD']:
+                        words.append(self.blocks[child].get('Text', ''))
+        return ' '.join(words) if words else None
+
+    def element(self, index: int) -> dict:
+        element = {'id': self.ids[index],
+                   'blockType': BLOCK_TYPES[self.types[index]],
+                   'confidence': self.confidences[index],
+                   'boundingBox': self.blocks[index].get('Geometry', {}).get('BoundingBox')}
+        text = self.text(index)
+        if text is not None:
+            element['text'] = text
+        return element
+
+    def report(self, indexes: list, max_elements: int = 100) -> dict:
+        '''
+        Confidence report of the low confidence blocks with their bounding boxes so
+        reviewers can go straight to the problem regions
+        '''
+        return {'counts': self.count_by_type(indexes),
+                'elements': [self.element(index) for index in indexes[:max_elements]],
+                'truncated': len(indexes) > max_elements}
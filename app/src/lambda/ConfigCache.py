@@ -0,0 +1,72 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import logging
+import threading
+import time
+from Clients import get_client
+
+logger = logging.getLogger(__name__)
+
+def ssm_parameter(name: str) -> str:
+    return get_client('ssm').get_parameter(Name=name)['Parameter']['Value']
+
+'''
+Container wide cache of configuration values such as the confidence thresholds.
+Values are kept for ttl seconds, concurrent misses of the same name wait for a
+single fetch, and when a refresh fails the last known value is served and the
+refresh is retried after retry_after seconds instead of failing the caller
+'''
+class ConfigCache:
+    def __init__(self, ttl: float = 300, retry_after: float = 30, fetch=ssm_parameter, log_level: str = 'INFO'):
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.fetch = fetch
+        self._values = dict()
+        self._locks = dict()
+        self._guard = threading.Lock()
+        logger.setLevel(log_level)
+
+    def _lock(self, name: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _fresh(self, name: str):
+        entry = self._values.get(name)
+        if entry and entry[1] > time.monotonic():
+            return entry
+        return None
+
+    def get(self, name: str, parse=None):
+        '''
+        Returns the value of name, parsed with parse when given. Only the parsed value is
+        cached so a value that doesn't parse is handled like a failed fetch
+        '''
+        entry = self._fresh(name)
+        if entry:
+            return entry[0]
+        with self._lock(name):
+            # another thread may have refreshed the value while this one was waiting
+            entry = self._fresh(name)
+            if entry:
+                return entry[0]
+            try:
+                raw = self.fetch(name)
+                value = parse(raw) if parse else raw
+            except Exception as e:
+                stale = self._values.get(name)
+                if stale is None:
+                    logger.error(f"Unable to load configuration {name}: {e}")
+                    raise e
+                logger.warning(f"Unable to refresh configuration {name}, using last known value: {e}")
+                self._values[name] = (stale[0], time.monotonic() + self.retry_after)
+                return stale[0]
+            logger.info(f"Loaded configuration {name}: {value}")
+            self._values[name] = (value, time.monotonic() + self.ttl)
+            return value
+
+    def invalidate(self, name: str = None) -> None:
+        if name is None:
+            self._values.clear()
+        else:
+            self._values.pop(name, None)
@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import logging
+import mimetypes
+import os
+import io
+import tempfile
+from S3Functions import S3
+from TiffFrames import TiffIndex
+
+logger = logging.getLogger(__name__)
+
+# Mime types for Amazon Textract supported file formats
+PDF_MIME='application/pdf'
+PNG_MIME='image/png'
+JPG_MIME='image/jpeg'
+TIF_MIME='image/tiff'
+
+'''
+Source document downloaded once into Lambda /tmp. The PDF reader or image
+handle is opened on first use and shared by all page extractions, pypdf and
+Pillow are only imported then
+'''
+class SourceDocument:
+    def __init__(self, bucket: str, key: str, etag: str, log_level: str = 'INFO'):
+        self.bucket = bucket
+        self.key = key
+        self.etag = etag
+        self.mime = mimetypes.guess_type(key, strict=True)[0]
+        self.extension = mimetypes.guess_all_extensions(self.mime, strict=True)[0] if self.mime else None
+        logger.debug(f"File mime type is {self.mime} and extension is {self.extension}")
+
+        fd, self.path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        logger.info(f"Downloading document s3://{bucket}/{key} to {self.path}")
+        S3(bucket=bucket, log_level=log_level).download_file(source_object=key, destination_file=self.path)
+        self._handle = None
+        self._tiff_index = None
+
+    @property
+    def filename(self) -> str:
+        return os.path.basename(self.key)
+
+    @property
+    def handle(self):
+        if self._handle is None:
+            if self.mime == PDF_MIME:
+                from pypdf import PdfReader
+                self._handle = PdfReader(self.path)
+            elif self.mime == TIF_MIME:
+                from PIL import Image
+                self._handle = Image.open(self.path)
+            else:
+                raise Exception(f"Un-supported file type {self.mime} for s3://{self.bucket}/{self.key}")
+        return self._handle
+
+    def pdf_page(self, page_num: int):
+        return self.handle.pages[page_num - 1]
+
+    def tiff_frame(self, page_num: int):
+        img = self.handle
+        img.seek(page_num - 1)
+        return img
+
+    def tiff_page(self, page_num: int) -> bytes:
+        '''
+        Single page TIFF of page_num. Frames are copied straight out of the IFD index,
+        files the index can't handle are decoded and re-encoded with Pillow
+        '''
+        if self._tiff_index is None:
+            try:
+                self._tiff_index = TiffIndex(self.path)
+            except ValueError as e:
+                logger.info(f"Extracting TIFF pages of s3://{self.bucket}/{self.key} with Pillow: {e}")
+                self._tiff_index = False
+        if self._tiff_index:
+            return self._tiff_index.frame(page_num - 1)
+        out = io.BytesIO()
+        self.tiff_frame(page_num).save(out, format='TIFF')
+        return out.getvalue()
+
+    def close(self) -> None:
+        if self.mime == TIF_MIME and self._handle is not None:
+            self._handle.close()
+        if self._tiff_index:
+            self._tiff_index.close()
+        self._handle = None
+        self._tiff_index = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+'''
+Per-invocation cache of source documents keyed by bucket, key and ETag so a
+document with many flagged pages is downloaded and parsed only once
+'''
+class DocumentCache:
+    def __init__(self, log_level: str = 'INFO'):
+        self._documents = dict()
+        self.log_level = log_level
+        logger.setLevel(log_level)
+
+    def get(self, bucket: str, key: str) -> SourceDocument:
+        etag = S3(bucket=bucket, log_level=self.log_level).head_object(key=key).get('ETag')
+        cache_key = (bucket, key, etag)
+        document = self._documents.get(cache_key)
+        if document is None:
+            # a new version of the same object replaces the stale one
+            for stale in [k for k in self._documents if k[:2] == (bucket, key)]:
+                self._documents.pop(stale).close()
+            document = SourceDocument(bucket, key, etag, log_level=self.log_level)
+            self._documents[cache_key] = document
+        else:
+            logger.debug(f"Using cached document s3://{bucket}/{key} ({etag})")
+        return document
+
+    def clear(self) -> None:
+        for document in self._documents.values():
+            document.close()
+        self._documents.clear()
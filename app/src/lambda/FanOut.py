@@ -0,0 +1,91 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from Clients import get_client
+from JsonStream import JsonStream
+
+logger = logging.getLogger(__name__)
+
+'''
+Coordinator side of the process-output fan-out mode. The coordinator reads
+where each Textract output part starts and splits the document into page
+range work items that are processed by separate workers
+'''
+
+def part_start(s3, key: str) -> dict:
+    '''
+    Reads the beginning of an output part up to its first block and returns the
+    page that block belongs to, along with the part header read so far
+    '''
+    body = s3.get_object_stream(key=key)
+    header = dict()
+    try:
+        for item_key, value in JsonStream(body).iter_items('Blocks'):
+            if item_key != 'Blocks':
+                header[item_key] = value
+                continue
+            return {'key': key,
+                    'header': header,
+                    'first_page': value.get('Page', 1),
+                    'starts_with_page': value.get('BlockType') == "PAGE"}
+    finally:
+        body.close()
+    return {'key': key, 'header': header, 'first_page': None, 'starts_with_page': False}
+
+def part_boundaries(s3, keys: list, max_workers: int = 8) -> list:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [part for part in executor.map(lambda key: part_start(s3, key), keys) if part['first_page']]
+
+def plan_work_items(parts: list, total_pages: int, pages_per_worker: int) -> list:
+    '''
+    Splits pages 1..total_pages into ranges of pages_per_worker pages, each with the
+    output parts that hold the blocks of its pages. A page can continue into the next
+    part, so a range starts at the last part where its first page begins
+    '''
+    items = list()
+    for first_page in range(1, total_pages + 1, pages_per_worker):
+        last_page = min(first_page + pages_per_worker - 1, total_pages)
+        start = 0
+        for index, part in enumerate(parts):
+            if part['first_page'] < first_page or (part['first_page'] == first_page and part['starts_with_page']):
+                start = index
+        keys = [part['key'] for index, part in enumerate(parts) if index >= start and part['first_page'] <= last_page]
+        items.append({'first_page': first_page, 'last_page': last_page, 'parts': keys})
+    return items
+
+'''
+Runs each work item as an asynchronous invocation of the process-output function
+'''
+class LambdaExecutor:
+    def __init__(self, function_name: str, log_level: str = 'INFO'):
+        self.function_name = function_name
+        self.client = get_client('lambda')
+        logger.setLevel(log_level)
+
+    def run(self, items: list) -> list:
+        results = list()
+        for item in items:
+            logger.info(f"Invoking {self.function_name} for pages {item['first_page']}-{item['last_page']}")
+            response = self.client.invoke(FunctionName=self.function_name,
+                                          InvocationType='Event',
+                                          Payload=json.dumps({'fanout': item}).encode())
+            results.append({'first_page': item['first_page'],
+                            'last_page': item['last_page'],
+                            'StatusCode': response.get('StatusCode')})
+        return results
+
+'''
+Runs work items in process on a thread pool, stands in for Lambda when testing locally
+'''
+class LocalExecutor:
+    def __init__(self, worker, max_workers: int = 4, log_level: str = 'INFO'):
+        self.worker = worker
+        self.max_workers = max_workers
+        logger.setLevel(log_level)
+
+    def run(self, items: list) -> list:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.worker, items))
@@ -0,0 +1,112 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import codecs
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+# Characters that can follow a complete value, anything else means the value may continue in the next chunk
+_value_end = _whitespace + ',]}:'
+
+'''
+Incremental JSON reader over a file-like byte stream (e.g. the S3 StreamingBody).
+Only the members of the array being streamed are ever fully materialized, so
+memory is bounded by the largest single element instead of the whole document.
+'''
+class JsonStream:
+    def __init__(self, stream, chunk_size: int = 65536):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            text = self._utf8.decode(b'', final=True)
+        else:
+            text = self._utf8.decode(chunk)
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return bool(chunk)
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _whitespace:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char: str) -> None:
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found or 'EOF'}' while streaming JSON")
+        self._pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+                # a value not followed by a delimiter may be truncated, e.g. a number cut after '.' or 'e'
+                if (end < len(self._buf) and self._buf[end] in _value_end) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def _members(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._peek() == ',':
+                self._pos += 1
+                continue
+            self._expect(']')
+            return
+
+    def iter_items(self, stream_key: str):
+        '''
+        Iterates over the (key, value) pairs of a top level JSON object. The array
+        under stream_key is not loaded at once, a (stream_key, element) pair is
+        yielded for each of its elements instead.
+        '''
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == stream_key:
+                for member in self._members():
+                    yield key, member
+            else:
+                yield key, self._value()
+            if self._peek() == ',':
+                self._pos += 1
+                continue
+            self._expect('}')
+            return
+
+    def iter_array(self):
+        '''
+        Iterates over the elements of a top level JSON array
+        '''
+        yield from self._members()
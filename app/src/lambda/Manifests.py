@@ -1,7 +1,6 @@
 import logging
 import json
 from dataclasses import dataclass
-from marshmallow import Schema, fields
 
 logger = logging.getLogger(__name__)
 
@@ -17,23 +16,78 @@ class TextractDict:
   Warnings: str
 
 
-class TextractSchema(Schema):
-  class Meta:
-    ordered = True
+_schema = None
 
-  AnalyzeDocumentModelVersion = fields.Str(required=True)
-  Blocks = fields.List(fields.Dict(), required=True)
-  DocumentMetadata = fields.Dict()
-  JobStatus = fields.Str(required=True)
-  NextToken = fields.Str(required=False)
-  StatusMessage = fields.Str(required=False)
-  Warnings = fields.Str(required=False)
+def textract_schema():
+  '''
+  Marshmallow schema of a Textract page, defined on first use so marshmallow is
+  only imported by the legacy tManifest property and never on the toBytes path
+  '''
+  global _schema
+  if _schema is None:
+    from marshmallow import Schema, fields
+
+    class TextractSchema(Schema):
+      class Meta:
+        ordered = True
+
+      AnalyzeDocumentModelVersion = fields.Str(required=True)
+      Blocks = fields.List(fields.Dict(), required=True)
+      DocumentMetadata = fields.Dict()
+      JobStatus = fields.Str(required=True)
+      NextToken = fields.Str(required=False)
+      StatusMessage = fields.Str(required=False)
+      Warnings = fields.Str(required=False)
+
+    _schema = TextractSchema()
+  return _schema
+
+
+def __getattr__(name):
+  # Manifests.TextractSchema keeps working without importing marshmallow up front
+  if name == 'TextractSchema':
+    return type(textract_schema())
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _has_none(obj) -> bool:
+  '''
+  Checks for None at any depth without copying. Textract JSON lists are homogeneous
+  so a list is only walked when its first element is itself a container
+  '''
+  if isinstance(obj, dict):
+    values = obj.values()
+    return None in values or any(_has_none(v) for v in values if isinstance(v, (dict, list)))
+  if isinstance(obj, list):
+    return bool(obj) and (None in obj or (isinstance(obj[0], (dict, list)) and any(_has_none(v) for v in obj)))
+  return False
+
+
+def _remove_none(obj):
+  if isinstance(obj, (list, tuple, set)):
+    return type(obj)(_remove_none(x) for x in obj if x is not None)
+  elif isinstance(obj, dict):
+    return type(obj)((_remove_none(k), _remove_none(v))
+                     for k, v in obj.items()
+                     if k is not None and v is not None)
+  else:
+    return obj
+
+
+'''
+Removes None type from JSON created by Textract async
+this makes it consumable for TRP. Blocks without a None
+are passed through as they are instead of being rebuilt
+'''
+def _drop_none(obj):
+  return _remove_none(obj) if _has_none(obj) else obj
 
 
 class tManifest:
+  __slots__ = ('_modelVersion', '_blocks', '_docMeta', '_status', '_nextToken', '_statusMsg', '_warnings')
 
   def __init__(self, tjson):
-    self._modelVersion = tjson["AnalyzeDocumentModelVersion"]
+    self._modelVersion = tjson.get("AnalyzeDocumentModelVersion")
     self._blocks = None
     self._docMeta = tjson["DocumentMetadata"]
     self._status = tjson["JobStatus"]
@@ -42,26 +96,14 @@ class tManifest:
     self._warnings = tjson["Warnings"] if "Warnings" in tjson else None
 
   '''
-  Removes None type from JSON created by Textract async
-  this makes it consumable for TRP
+  Marshmallow based serialization, kept for compatibility. toJson and toBytes
+  produce the same document without the schema round trip
   '''
-
-  def __remove_none(self, obj):
-    if isinstance(obj, (list, tuple, set)):
-      return type(obj)(self.__remove_none(x) for x in obj if x is not None)
-    elif isinstance(obj, dict):
-      return type(obj)((self.__remove_none(k), self.__remove_none(v))
-                       for k, v in obj.items()
-                       if k is not None and v is not None)
-    else:
-      return obj
-
   @property
   def tManifest(self):
-    txtrct = TextractDict(self._modelVersion, self._blocks, self._docMeta,
+    txtrct = TextractDict(self._modelVersion, _remove_none(self._blocks), self._docMeta,
                           self._status, None, None, None)
-    schema = TextractSchema()
-    return schema.dump(txtrct)
+    return textract_schema().dump(txtrct)
 
   @property
   def blocks(self):
@@ -69,8 +111,40 @@ class tManifest:
 
   @property
   def toJson(self):
-    data = self.tManifest
-    return data
+    return {"AnalyzeDocumentModelVersion": self._modelVersion,
+            "Blocks": [_drop_none(block) for block in self._blocks] if self._blocks is not None else None,
+            "DocumentMetadata": self._docMeta,
+            "JobStatus": self._status,
+            "NextToken": None,
+            "StatusMessage": None,
+            "Warnings": None}
+
+  def toBytes(self) -> bytes:
+    '''
+    Encodes the blocks straight away and only drops None values when the encoded
+    blocks contain a null, the usual Textract output is written without any copy
+    '''
+    blocks = json.dumps(self._blocks)
+    if 'null' in blocks and self._blocks is not None:
+      # Textract nulls are top level block fields, nested ones take the full walk
+      blocks = json.dumps([{k: v for k, v in block.items() if v is not None} if None in block.values() else block
+                           for block in self._blocks])
+      if 'null' in blocks:
+        blocks = json.dumps([_drop_none(block) for block in self._blocks])
+    return (f'{{"AnalyzeDocumentModelVersion": {json.dumps(self._modelVersion)}, "Blocks": {blocks}, '
+            f'"DocumentMetadata": {json.dumps(self._docMeta)}, "JobStatus": {json.dumps(self._status)}, '
+            f'"NextToken": null, "StatusMessage": null, "Warnings": null}}').encode()
     
+  def with_blocks(self, blocks):
+    '''
+    Copy of the manifest holding blocks instead of the blocks of this one, e.g. the blocks of a review region
+    '''
+    manifest = tManifest.__new__(tManifest)
+    for slot in tManifest.__slots__:
+      setattr(manifest, slot, getattr(self, slot))
+    manifest._blocks = blocks
+    return manifest
+
   def add_blocks(self, blocks):
-    self._blocks = self.__remove_none(blocks)
+    # None values are dropped when the manifest is encoded
+    self._blocks = blocks
@@ -0,0 +1,154 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from S3Functions import S3
+from DocumentCache import SourceDocument, PDF_MIME, PNG_MIME, JPG_MIME, TIF_MIME
+from Renditions import Renditioner, page_image
+from RegionCrops import crop_region, encode_crop, CROP_EXTENSION, CROP_MIME
+
+logger = logging.getLogger(__name__)
+
+'''
+Splits all flagged pages of a source document in one pass. Every single page
+document is written into an in-memory buffer and uploaded with put_object on
+a bounded thread pool while the next page is being extracted. With a renditioner
+the web preview of every page is encoded and uploaded on the same pool. Pages
+with review regions are uploaded as crops of those regions instead of whole
+'''
+class PageExtractor:
+    def __init__(self, document: SourceDocument, bucket: str, prefix: str, max_workers: int = 8, log_level: str = 'INFO',
+                 renditioner: Renditioner = None):
+        self.document = document
+        self.renditioner = renditioner
+        self.renditions = dict()
+        self.regions = dict()
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_workers = max_workers
+        self.log_level = log_level
+        logger.setLevel(log_level)
+
+    def page_key(self, page_num: int) -> str:
+        return f"{self.prefix}/pages/{page_num}/page/{page_num}{self.document.extension}"
+
+    def rendition_key(self, page_num: int) -> str:
+        return f"{self.prefix}/pages/{page_num}/rendition/{page_num}{self.renditioner.extension}"
+
+    def tile_key(self, page_num: int, row: int, column: int) -> str:
+        return f"{self.prefix}/pages/{page_num}/rendition/tiles/{row}-{column}{self.renditioner.extension}"
+
+    def region_prefix(self, page_num: int, index: int) -> str:
+        return f"{self.prefix}/pages/{page_num}/regions/{index}"
+
+    def region_key(self, page_num: int, index: int) -> str:
+        # same layout as a page so a region task is reviewed and cleaned up like a page task
+        return f"{self.region_prefix(page_num, index)}/page/{page_num}{CROP_EXTENSION}"
+
+    def page_image(self, page_num: int, page: bytes) -> tuple:
+        '''
+        Reads the page image on the calling thread, the PDF reader is not shared with the pool
+        '''
+        try:
+            return page_image(self.document, page_num, page)
+        except Exception as e:
+            logger.error(f"Unable to read the image of page {page_num} of s3://{self.document.bucket}/{self.document.key}: {e}")
+            return None, None
+
+    def upload_region(self, s3_doc_client: S3, page_num: int, index: int, crop) -> None:
+        s3_doc_client.put_object(key=self.region_key(page_num, index), body=encode_crop(crop), ContentType=CROP_MIME)
+
+    def upload_rendition(self, s3_doc_client: S3, page_num: int, img, dpi: float) -> None:
+        '''
+        Encodes and uploads the rendition of a page and records its task fields. The rendition
+        is optional, on failure the page is reviewed from the original
+        '''
+        try:
+            rendition = self.renditioner.render(img, dpi)
+            mime = self.renditioner.mime
+            s3_doc_client.put_object(key=self.rendition_key(page_num), body=rendition['image'], ContentType=mime)
+            fields = {'renditionS3Uri': f"s3://{self.bucket}/{self.rendition_key(page_num)}"}
+            if rendition['tiles']:
+                for (row, column), tile in rendition['tiles'].items():
+                    s3_doc_client.put_object(key=self.tile_key(page_num, row, column), body=tile, ContentType=mime)
+                rows, columns = max(rendition['tiles'])
+                fields['renditionTiles'] = {'s3Prefix': f"s3://{self.bucket}/{self.prefix}/pages/{page_num}/rendition/tiles",
+                                            'tileSize': self.renditioner.tile_size,
+                                            'rows': rows + 1,
+                                            'columns': columns + 1,
+                                            'width': rendition['width'],
+                                            'height': rendition['height'],
+                                            'fileExtension': self.renditioner.extension}
+            self.renditions[page_num] = fields
+        except Exception as e:
+            logger.error(f"Unable to create the rendition of page {page_num} of s3://{self.document.bucket}/{self.document.key}: {e}")
+
+    def render(self, page_num: int) -> bytes:
+        '''
+        Returns the single page document for page_num
+        '''
+        mime = self.document.mime
+        # Handle image files
+        if mime in [PNG_MIME, JPG_MIME]:
+            with open(self.document.path, 'rb') as source:
+                return source.read()
+        # Handle TIF files, frames are copied out without recompression
+        if mime == TIF_MIME:
+            return self.document.tiff_page(page_num)
+        # Handle PDF files
+        if mime == PDF_MIME:
+            from pypdf import PdfWriter
+            out = io.BytesIO()
+            writer = PdfWriter()
+            writer.add_page(self.document.pdf_page(page_num)) # Extract the specific page
+            writer.write(out)
+            return out.getvalue()
+        raise Exception(f"Un-supported file type {mime} for s3://{self.document.bucket}/{self.document.key}")
+
+    def extract_pages(self, page_nums: list, regions: dict = None) -> dict:
+        '''
+        Extracts and uploads every page in page_nums, returns a page number to S3 key mapping.
+        Pages listed in regions (page number to review regions) are uploaded as region crops,
+        recorded in self.regions, unless the page has no image to crop from
+        '''
+        regions = regions or dict()
+        s3_doc_client = S3(bucket=self.bucket, log_level=self.log_level)
+        uploads = dict()
+        page_keys = dict()
+        # pages are visited in document order so multi-frame sources are read front to back
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = set()
+            for page_num in sorted(set(page_nums)):
+                # bound the number of page buffers waiting for upload
+                if len(in_flight) >= self.max_workers:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                page = self.render(page_num)
+                if page_num in regions:
+                    img, _ = self.page_image(page_num, page)
+                    if img is not None:
+                        # regions are cropped here, the page image is not shared with the pool
+                        crops = [crop_region(img, region['boundingBox']) for region in regions[page_num]]
+                        uploads[page_num] = [executor.submit(self.upload_region, s3_doc_client, page_num, index, crop)
+                                             for index, crop in enumerate(crops)]
+                        in_flight.update(uploads[page_num])
+                        self.regions[page_num] = regions[page_num]
+                        continue
+                    logger.info(f"Page {page_num} has no image to crop regions from, it is reviewed as a whole page")
+                upload = executor.submit(s3_doc_client.put_object,
+                                         key=self.page_key(page_num),
+                                         body=page,
+                                         ContentType=self.document.mime)
+                uploads[page_num] = [upload]
+                page_keys[page_num] = self.page_key(page_num)
+                in_flight.add(upload)
+                if self.renditioner:
+                    img, dpi = self.page_image(page_num, page)
+                    if img is not None:
+                        in_flight.add(executor.submit(self.upload_rendition, s3_doc_client, page_num, img, dpi))
+        failed = [page_num for page_num, page_uploads in uploads.items() if any(upload.exception() for upload in page_uploads)]
+        if failed:
+            raise Exception(f"Unable to upload pages {failed} of s3://{self.document.bucket}/{self.document.key}")
+        logger.info(f"Extracted {len(page_keys)} pages and the regions of {len(self.regions)} pages of s3://{self.document.bucket}/{self.document.key}")
+        return page_keys
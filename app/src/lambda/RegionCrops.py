@@ -0,0 +1,135 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import io
+import logging
+import math
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Crops are written as PNG, lossless so the low confidence characters are not blurred any further
+CROP_EXTENSION = '.png'
+CROP_MIME = 'image/png'
+
+def _near(region: list, other: list, gap: float) -> bool:
+    return (region[0] <= other[2] + gap and other[0] <= region[2] + gap and
+            region[1] <= other[3] + gap and other[1] <= region[3] + gap)
+
+def plan_regions(elements: list, padding: float = 0.01, merge_gap: float = 0.02) -> list:
+    '''
+    Groups low confidence elements (as listed in the confidence report) into review regions.
+    Every element box is padded by padding, boxes closer than merge_gap are merged, all in
+    page relative coordinates. Returns the regions top to bottom with their bounding box and
+    elements, or None when an element has no geometry and the page can't be cropped
+    '''
+    regions = list()
+    for element in elements:
+        box = element.get('boundingBox')
+        if not box:
+            return None
+        # left, top, right, bottom, elements
+        region = [max(0.0, box['Left'] - padding), max(0.0, box['Top'] - padding),
+                  min(1.0, box['Left'] + box['Width'] + padding), min(1.0, box['Top'] + box['Height'] + padding),
+                  [element]]
+        # a grown region can reach regions that didn't touch it before
+        merged = True
+        while merged:
+            merged = False
+            for other in regions:
+                if _near(region, other, merge_gap):
+                    regions.remove(other)
+                    region = [min(region[0], other[0]), min(region[1], other[1]),
+                              max(region[2], other[2]), max(region[3], other[3]),
+                              other[4] + region[4]]
+                    merged = True
+                    break
+        regions.append(region)
+    regions.sort(key=lambda region: (region[1], region[0]))
+    return [{'boundingBox': {'Left': left, 'Top': top, 'Width': right - left, 'Height': bottom - top},
+             'elements': sorted(members, key=lambda element: (element['boundingBox']['Top'], element['boundingBox']['Left']))}
+            for left, top, right, bottom, members in regions]
+
+def region_area(regions: list) -> float:
+    '''
+    Share of the page covered by the regions, regions never overlap once merged
+    '''
+    return sum(region['boundingBox']['Width'] * region['boundingBox']['Height'] for region in regions)
+
+def rebase_box(box: dict, region_box: dict) -> dict:
+    '''
+    Converts a page relative bounding box into one relative to the crop of region_box
+    '''
+    return {'Left': (box['Left'] - region_box['Left']) / region_box['Width'],
+            'Top': (box['Top'] - region_box['Top']) / region_box['Height'],
+            'Width': box['Width'] / region_box['Width'],
+            'Height': box['Height'] / region_box['Height']}
+
+def _inside(block: dict, region_box: dict) -> bool:
+    box = block.get('Geometry', {}).get('BoundingBox')
+    if not box:
+        return False
+    x = box['Left'] + box['Width'] / 2
+    y = box['Top'] + box['Height'] / 2
+    return (region_box['Left'] <= x <= region_box['Left'] + region_box['Width'] and
+            region_box['Top'] <= y <= region_box['Top'] + region_box['Height'])
+
+def region_blocks(blocks: list, region_box: dict) -> list:
+    '''
+    Blocks of a page that belong to a region, with their geometry relative to the region crop
+    so the crop is reviewed like a page. A block belongs to the region when the center of its
+    box lies inside it, the PAGE block covers the whole crop and relationships to blocks
+    outside the region are dropped
+    '''
+    selected = [block for block in blocks if block.get('BlockType') == 'PAGE' or _inside(block, region_box)]
+    ids = {block['Id'] for block in selected}
+    rebased = list()
+    for block in selected:
+        block = dict(block)
+        if block.get('BlockType') == 'PAGE':
+            block['Geometry'] = {'BoundingBox': {'Left': 0.0, 'Top': 0.0, 'Width': 1.0, 'Height': 1.0},
+                                 'Polygon': [{'X': 0.0, 'Y': 0.0}, {'X': 1.0, 'Y': 0.0}, {'X': 1.0, 'Y': 1.0}, {'X': 0.0, 'Y': 1.0}]}
+        elif block.get('Geometry'):
+            geometry = dict(block['Geometry'])
+            geometry['BoundingBox'] = rebase_box(geometry['BoundingBox'], region_box)
+            if geometry.get('Polygon'):
+                geometry['Polygon'] = [{'X': (point['X'] - region_box['Left']) / region_box['Width'],
+                                        'Y': (point['Y'] - region_box['Top']) / region_box['Height']}
+                                       for point in geometry['Polygon']]
+            block['Geometry'] = geometry
+        if block.get('Relationships'):
+            relationships = [{**rel, 'Ids': [block_id for block_id in rel['Ids'] if block_id in ids]}
+                             for rel in block['Relationships']]
+            block['Relationships'] = [rel for rel in relationships if rel['Ids']]
+        rebased.append(block)
+    return rebased
+
+def region_report(region: dict) -> dict:
+    '''
+    Confidence report of a region with the element boxes relative to the region crop
+    '''
+    elements = [{**element, 'boundingBox': rebase_box(element['boundingBox'], region['boundingBox'])}
+                for element in region['elements']]
+    return {'counts': dict(Counter(element['blockType'] for element in elements)),
+            'elements': elements,
+            'truncated': False}
+
+def crop_region(img, bounding_box: dict):
+    '''
+    Crops a page relative bounding box out of the page image as displayed (Renditions.page_image),
+    the frame Textract geometry is relative to. Crops are taken on one thread, PIL images are
+    not safe to read from several threads
+    '''
+    left = math.floor(bounding_box['Left'] * img.width)
+    top = math.floor(bounding_box['Top'] * img.height)
+    right = min(img.width, math.ceil((bounding_box['Left'] + bounding_box['Width']) * img.width))
+    bottom = min(img.height, math.ceil((bounding_box['Top'] + bounding_box['Height']) * img.height))
+    crop = img.crop((left, top, max(right, left + 1), max(bottom, top + 1)))
+    if crop.mode not in ('1', 'L', 'RGB'):
+        crop = crop.convert('L' if crop.mode in ('I', 'I;16') else 'RGB')
+    return crop
+
+def encode_crop(crop) -> bytes:
+    out = io.BytesIO()
+    crop.save(out, format='PNG', optimize=True)
+    return out.getvalue()
@@ -0,0 +1,87 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import io
+import logging
+from DocumentCache import SourceDocument, PDF_MIME
+
+logger = logging.getLogger(__name__)
+
+# Encoders for the supported rendition formats, (Pillow format, file extension, content type)
+RENDITION_FORMATS = {'webp': ('WEBP', '.webp', 'image/webp'),
+                     'jpeg': ('JPEG', '.jpg', 'image/jpeg')}
+# Resolution assumed for images that don't record one
+DEFAULT_SOURCE_DPI = 300
+# Relative difference of aspect ratios up to which an embedded image is taken to cover its PDF page
+SCAN_ASPECT_TOLERANCE = 0.02
+
+def page_image(document: SourceDocument, page_num: int, page: bytes) -> tuple:
+    '''
+    Returns the page image as displayed and its resolution in dots per inch, or (None, None).
+    PDF pages are only imaged from a scan, a single embedded image matching the shape of the
+    page, turned by the page rotation since Textract geometry is relative to the displayed page
+    '''
+    from PIL import Image
+    if document.mime != PDF_MIME:
+        # single page TIFF, PNG or JPG as uploaded for review
+        img = Image.open(io.BytesIO(page))
+        dpi = img.info.get('dpi', (DEFAULT_SOURCE_DPI,))[0] or DEFAULT_SOURCE_DPI
+        return img, float(dpi)
+    pdf_page = document.pdf_page(page_num)
+    images = list(pdf_page.images)
+    if len(images) != 1:
+        return None, None
+    img = images[0].image
+    width, height = float(pdf_page.mediabox.width), float(pdf_page.mediabox.height)
+    rotation = (pdf_page.rotation or 0) % 360
+    if rotation in (90, 270):
+        width, height = height, width
+    if rotation:
+        # /Rotate turns the page clockwise, PIL rotates counter clockwise
+        img = img.rotate(-rotation, expand=True)
+    if abs(img.width / img.height - width / height) > SCAN_ASPECT_TOLERANCE * width / height:
+        # the image doesn't cover the page, its crops would not match the Textract geometry
+        return None, None
+    # points are 1/72 inch
+    return img, img.width * 72 / width
+
+'''
+Web optimized previews of extracted pages for the reviewer UI. A page is scaled
+down to at most max_dpi and encoded as WebP or JPEG, optionally also cut into
+square tiles. PDF pages are previewed from their largest embedded image (scanned
+documents); pages without one get no rendition and the UI shows the original
+'''
+class Renditioner:
+    def __init__(self, image_format: str = 'webp', max_dpi: int = 150, quality: int = 80, tile_size: int = 0):
+        if image_format not in RENDITION_FORMATS:
+            raise ValueError(f"Un-supported rendition format {image_format}, expected one of {list(RENDITION_FORMATS)}")
+        self.pil_format, self.extension, self.mime = RENDITION_FORMATS[image_format]
+        self.max_dpi = max_dpi
+        self.quality = quality
+        self.tile_size = tile_size
+
+    def encode(self, img) -> bytes:
+        out = io.BytesIO()
+        if self.pil_format == 'WEBP':
+            img.save(out, format='WEBP', quality=self.quality, method=4)
+        else:
+            img.save(out, format='JPEG', quality=self.quality, optimize=True, progressive=True)
+        return out.getvalue()
+
+    def render(self, img, dpi: float) -> dict:
+        '''
+        Returns the encoded rendition of a page image with its size and tiles keyed by (row, column)
+        '''
+        from PIL import Image
+        img = img.convert('L' if img.mode in ('1', 'L', 'I', 'I;16') else 'RGB')
+        scale = min(1.0, self.max_dpi / dpi)
+        if scale < 1.0:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            img = img.resize(size, Image.LANCZOS, reducing_gap=2.0)
+        rendition = {'image': self.encode(img), 'width': img.width, 'height': img.height, 'tiles': dict()}
+        if self.tile_size:
+            for top in range(0, img.height, self.tile_size):
+                for left in range(0, img.width, self.tile_size):
+                    tile = img.crop((left, top, min(left + self.tile_size, img.width), min(top + self.tile_size, img.height)))
+                    rendition['tiles'][(top // self.tile_size, left // self.tile_size)] = self.encode(tile)
+        return rendition
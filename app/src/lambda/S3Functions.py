@@ -1,36 +1,76 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-import boto3
 import logging
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from Clients import get_client
+
+# Maximum number of keys in a single DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+# Largest object copied with a single CopyObject request, larger objects use a multipart copy
+COPY_OBJECT_MAX_SIZE = 5 * 1024 ** 3
+# Concurrent copy requests of copy_objects and move_objects
+TRANSFER_WORKERS = 10
 
-s3 = boto3.client('s3')
-s3_resource = boto3.resource('s3')
 logger = logging.getLogger(__name__)
 
+def key_matcher(filters: list = None, search: list = None):
+    '''
+    Compiles the search and filter substrings once into a single alternation regex each
+    and returns a predicate selecting keys that contain any search string and none of
+    the filter strings. Folder placeholder keys ending in / are never selected
+    '''
+    searched = re.compile('|'.join(map(re.escape, search))).search if search else None
+    filtered = re.compile('|'.join(map(re.escape, filters))).search if filters else None
+
+    def matches(key: str) -> bool:
+        if key.endswith("/"):
+            return False
+        if searched and not searched(key):
+            return False
+        return not (filtered and filtered(key))
+    return matches
+
+'''
+Outcome of a bulk copy or move. Lists the copied and deleted source keys and
+the source keys that failed with their error, evaluates to False on any failure
+'''
+class TransferResult:
+    def __init__(self):
+        self.total = 0
+        self.copied = list()
+        self.deleted = list()
+        self.failed = dict()
+
+    def __bool__(self) -> bool:
+        return not self.failed
+
+    def __repr__(self) -> str:
+        return f"TransferResult(total={self.total}, copied={len(self.copied)}, deleted={len(self.deleted)}, failed={len(self.failed)})"
+
 class S3:
     def __init__(self, bucket: str, log_level: str ='INFO'):
         self.bucket=bucket
+        self.client = get_client('s3')
         logger.setLevel(log_level)
     
+    def iter_objects(self, prefix: str, filters: list = None, search: list = None):
+        '''
+        Lazily yields the keys under prefix page by page so memory stays flat on large prefixes
+        '''
+        logger.info(f"Attempting file listing for bucket: {self.bucket}, prefix: {prefix}, filters: {filters}, searches: {search}")
+        matches = key_matcher(filters=filters, search=search)
+        for page in self.list_pages(prefix=prefix):
+            for obj in page.get('Contents', []):
+                if matches(obj['Key']):
+                    yield obj['Key']
+
     def list_objects(self, prefix: str, filters: list = None, search: list = None) -> list:
         try:
-            logger.info(f"Attempting file listing for bucket: {self.bucket}, prefix: {prefix}, filters: {filters}, searches: {search}")
-            obj_bucket = s3_resource.Bucket(self.bucket)
-            logger.debug(obj_bucket)
-            
-            processed_files = None
-            
-            if filters and not search:
-                processed_files = [obj.key for obj in obj_bucket.objects.filter(Prefix=prefix) if not obj.key.endswith("/") and not any(x in obj.key for x in filters)]
-            elif search and not filters:
-                processed_files = [obj.key for obj in obj_bucket.objects.filter(Prefix=prefix) if not obj.key.endswith("/") and any(x in obj.key for x in search)]
-            elif search and filters:
-                processed_files = [obj.key for obj in obj_bucket.objects.filter(Prefix=prefix) if not obj.key.endswith("/") and any(x in obj.key for x in search)]
-                processed_files = [key for key in processed_files if not any(x in key for x in filters)]
-            else:
-                processed_files = [obj.key for obj in obj_bucket.objects.filter(Prefix=prefix) if not obj.key.endswith("/")]
+            processed_files = list(self.iter_objects(prefix=prefix, filters=filters, search=search))
             logger.debug(processed_files)
             
             return processed_files
@@ -38,12 +78,20 @@ class S3:
             logger.error(e)
             raise e
     
+    def list_pages(self, prefix: str, delimiter: str = None):
+        '''
+        Yields every response page of a list_objects_v2 listing, following the continuation tokens
+        '''
+        params = dict(Bucket=self.bucket, Prefix=prefix)
+        if delimiter:
+            params['Delimiter'] = delimiter
+        yield from self.client.get_paginator('list_objects_v2').paginate(**params)
+
     def list_prefixes(self, prefix: str) -> list:
         try:
             logger.info(f"Attempting prefix listing for bucket: {self.bucket}, prefix: {prefix}")
-            obj_bucket = s3.list_objects_v2(Bucket=self.bucket, Delimiter="/", Prefix=prefix.rstrip("/")+"/")
-            prefixes = obj_bucket['CommonPrefixes']
-            processed_files = [obj['Prefix'] for obj in prefixes if obj['Prefix'].endswith("/")]
+            pages = self.list_pages(prefix=prefix.rstrip("/")+"/", delimiter="/")
+            processed_files = [obj['Prefix'] for page in pages for obj in page.get('CommonPrefixes', []) if obj['Prefix'].endswith("/")]
             logger.debug(processed_files)
             
             return processed_files
@@ -55,7 +103,7 @@ class S3:
         try:
             logger.info(f"Attempting file reading object: {key} in bucket: {self.bucket}")
             
-            s3_response = s3.get_object(Bucket=self.bucket, Key=key)
+            s3_response = self.client.get_object(Bucket=self.bucket, Key=key)
             logger.debug(s3_response)
             
             content_stream = s3_response['Body']
@@ -68,28 +116,44 @@ class S3:
             logger.error(e)
             raise e
         
+    def head_object(self, key: str) -> dict:
+        try:
+            logger.info(f"Attempting to read metadata of object: {key} in bucket: {self.bucket}")
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+            logger.debug(response)
+            return response
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+    def get_object_stream(self, key: str):
+        try:
+            logger.info(f"Attempting streaming read of object: {key} in bucket: {self.bucket}")
+            
+            s3_response = self.client.get_object(Bucket=self.bucket, Key=key)
+            logger.debug(s3_response)
+            
+            return s3_response['Body']
+        except Exception as e:
+            logger.error(e)
+            raise e
+        
     def copy_object(self, source_object: str, destination_object: str) -> bool:
         try:
             logger.info(f"Attempting copy {source_object} to {destination_object} within bucket: {self.bucket}")
             copy_source = {'Bucket': self.bucket, 'Key': source_object }
             
-            response = s3_resource.Object(self.bucket, destination_object).copy(copy_source)
+            response = self.client.copy(copy_source, self.bucket, destination_object)
             logger.debug(response)
             return True
         except Exception as e:
             logger.error(e)
             raise e
             
-    def copy_objects(self, source_prefix: str, destination_prefix: str, filters: list = None, search: list = None) -> bool:
+    def copy_objects(self, source_prefix: str, destination_prefix: str, filters: list = None, search: list = None) -> TransferResult:
         try:
             logger.info(f"Attempting copy objects from {source_prefix} to {destination_prefix} within bucket: {self.bucket} and filter: {filters}")            
-            source_objects = self.list_objects(prefix=source_prefix, filters=filters, search=search)
-            logger.debug(source_objects)
-            for source_object in source_objects:                
-                file_name = os.path.basename(source_object)
-                destination_object = f"{destination_prefix.rstrip('/')}/{file_name}"                
-                self.copy_object(source_object=source_object, destination_object=destination_object)
-            return True
+            return self.transfer_objects(source_prefix=source_prefix, destination_prefix=destination_prefix, filters=filters, search=search)
         except Exception as e:
             logger.error(e)
             raise e
@@ -99,7 +163,7 @@ class S3:
             logger.info(f"Attempting move object {source_object} to {destination_object} within bucket: {self.bucket}")
             if self.copy_object(source_object=source_object, destination_object=destination_object):
                 logger.info(f"Attempting move delete source object {source_object} in bucket: {self.bucket}")
-                response = s3.delete_object(Bucket=self.bucket,Key=source_object)
+                response = self.client.delete_object(Bucket=self.bucket,Key=source_object)
                 
                 logger.debug(response)
                 return response
@@ -107,64 +171,134 @@ class S3:
             logger.error(e)
             raise e
     
-    def move_objects(self, source_prefix: str, destination_prefix: str, filters: list=None, search: list = None) -> bool:
+    def move_objects(self, source_prefix: str, destination_prefix: str, filters: list=None, search: list = None) -> TransferResult:
         try:
             logger.info(f"Attempting move objects from {source_prefix} to {destination_prefix} within bucket: {self.bucket} and filter: {filters}")            
-            source_objects = self.list_objects(prefix=source_prefix, filters=filters, search=search)
-            logger.debug(source_objects)
-            for source_object in source_objects:                
-                file_name = os.path.basename(source_object)
-                destination_object = f"{destination_prefix.rstrip('/')}/{file_name}"                
-                self.move_object(source_object=source_object, destination_object=destination_object)
-                
-            return True
+            return self.transfer_objects(source_prefix=source_prefix, destination_prefix=destination_prefix, filters=filters, search=search, delete_source=True)
         except Exception as e:
             logger.error(e)
             raise e
     
+    def _server_copy(self, source_object: str, destination_object: str, size: int) -> None:
+        copy_source = {'Bucket': self.bucket, 'Key': source_object}
+        if size > COPY_OBJECT_MAX_SIZE:
+            self.client.copy(copy_source, self.bucket, destination_object)
+        else:
+            self.client.copy_object(CopySource=copy_source, Bucket=self.bucket, Key=destination_object)
+
+    def _delete_sources(self, result: TransferResult, sources: list) -> None:
+        response = self.delete_objects(sources)
+        result.deleted.extend(item['Key'] for item in response['Deleted'])
+        for error in response['Errors']:
+            result.failed[error.get('Key')] = f"{error.get('Code')}: {error.get('Message')}"
+        sources.clear()
+
+    def transfer_objects(self, source_prefix: str, destination_prefix: str, filters: list = None, search: list = None,
+                         delete_source: bool = False, max_workers: int = TRANSFER_WORKERS) -> TransferResult:
+        '''
+        Copies every object under source_prefix into destination_prefix with server side copies
+        on a bounded thread pool while the listing is paged through. When delete_source is set
+        the copied sources are removed with DeleteObjects in batches of DELETE_BATCH_SIZE keys
+        '''
+        result = TransferResult()
+        destination_prefix = destination_prefix.rstrip('/')
+        matches = key_matcher(filters=filters, search=search)
+        pending_deletes = list()
+
+        def settle(done: set) -> None:
+            for copy in done:
+                source_object = in_flight.pop(copy)
+                if copy.exception():
+                    logger.error(f"Unable to copy {source_object} within bucket: {self.bucket}: {copy.exception()}")
+                    result.failed[source_object] = str(copy.exception())
+                    continue
+                result.copied.append(source_object)
+                if delete_source:
+                    pending_deletes.append(source_object)
+                    if len(pending_deletes) >= DELETE_BATCH_SIZE:
+                        self._delete_sources(result, pending_deletes)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = dict()
+            for page in self.list_pages(prefix=source_prefix):
+                for obj in page.get('Contents', []):
+                    source_object = obj['Key']
+                    if not matches(source_object):
+                        continue
+                    if len(in_flight) >= max_workers:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        settle(done)
+                    destination_object = f"{destination_prefix}/{os.path.basename(source_object)}"
+                    copy = executor.submit(self._server_copy, source_object, destination_object, obj.get('Size', 0))
+                    in_flight[copy] = source_object
+                    result.total += 1
+                logger.debug(f"Transfer of {source_prefix} in bucket: {self.bucket} at {result.total} objects")
+            settle(wait(in_flight).done)
+
+        if pending_deletes:
+            self._delete_sources(result, pending_deletes)
+        logger.info(f"Transferred objects from {source_prefix} to {destination_prefix} within bucket: {self.bucket}: {result}")
+        return result
+    
     def delete_objects(self, objects: list) -> dict:
+        '''
+        Deletes the keys in chunks of 1,000 (the DeleteObjects limit) and returns
+        the combined Deleted and Errors lists of all requests
+        '''
         try:
             logger.info(f"Attempting to delete {len(objects)} objects from bucket: {self.bucket}")
-            delete_us = dict(Objects=[])
-            
-            for item in objects:
-                delete_us['Objects'].append(dict(Key=item))
+            result = dict(Deleted=[], Errors=[])
             
-            logger.debug(delete_us)
-            response = s3.delete_objects(Bucket=self.bucket, Delete=delete_us)
-            logger.debug(response)
+            for start in range(0, len(objects), DELETE_BATCH_SIZE):
+                delete_us = dict(Objects=[dict(Key=item) for item in objects[start:start + DELETE_BATCH_SIZE]])
+                logger.debug(delete_us)
+                response = self.client.delete_objects(Bucket=self.bucket, Delete=delete_us)
+                logger.debug(response)
+                result['Deleted'].extend(response.get('Deleted', []))
+                result['Errors'].extend(response.get('Errors', []))
             
-            return response
+            for error in result['Errors']:
+                logger.error(f"Unable to delete {error.get('Key')} from bucket: {self.bucket}: {error.get('Code')} {error.get('Message')}")
+            return result
         except Exception as e:
             logger.error(e)
             raise e
     
     def delete_prefix(self, prefix: str, filters: list = None) -> dict:
         try:
-            logger.info(f"Attempting to delete {len(objects)} objects from bucket: {self.bucket}")
-            delete_us = dict(Objects=[])
-            
-            objects = self.list_objects(prefix=prefix, filters=filters)
-            
-            for item in objects:
-                delete_us['Objects'].append(dict(Key=item))
+            logger.info(f"Attempting to delete objects under prefix {prefix} from bucket: {self.bucket}")
+            result = dict(Deleted=[], Errors=[])
+            objects = self.iter_objects(prefix=prefix, filters=filters)
+            # delete while listing, one DeleteObjects request per batch of keys
+            while batch := list(islice(objects, DELETE_BATCH_SIZE)):
+                response = self.delete_objects(batch)
+                result['Deleted'].extend(response['Deleted'])
+                result['Errors'].extend(response['Errors'])
+            return result
+        except Exception as e:
+            logger.error(e)
+            raise e
             
-            logger.debug(delete_us)
-            response = s3.delete_objects(Bucket=self.bucket, Delete=delete_us)
+    def put_object(self, key: str, body, ContentType: str = None) -> dict:
+        try:
+            logger.info(f"Attempting to put object {key} to bucket: {self.bucket}")
+            if ContentType:
+                response = self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=ContentType)
+            else:
+                response = self.client.put_object(Bucket=self.bucket, Key=key, Body=body)
             logger.debug(response)
-            
             return response
         except Exception as e:
             logger.error(e)
             raise e
-            
+
     def upload_file(self, source_file: str, destination_object: str, ExtraArgs: dict = None) -> bool:
         try:
             logger.info(f"Attempting to upload file {source_file} to bucket: {self.bucket}, destination: {destination_object}")
             if ExtraArgs:
-                s3_resource.Bucket(self.bucket).upload_file(source_file, destination_object, ExtraArgs=ExtraArgs)
+                self.client.upload_file(source_file, self.bucket, destination_object, ExtraArgs=ExtraArgs)
             else:    
-                s3_resource.Bucket(self.bucket).upload_file(source_file, destination_object)
+                self.client.upload_file(source_file, self.bucket, destination_object)
             return True
         except Exception as e:
             logger.error(e)
@@ -173,8 +307,47 @@ class S3:
     def download_file(self, source_object: str, destination_file: str) -> bool:
         try:
             logger.info(f"Attempting to download file {source_object} from bucket: {self.bucket}, to : {destination_file}")
-            s3_resource.Bucket(self.bucket).download_file(source_object, destination_file)
+            self.client.download_file(self.bucket, source_object, destination_file)
             return True
         except Exception as e:
             logger.error(e)
-            raise e
\ No newline at end of file
+            raise e
+
+
+'''
+Uploads objects in the background on a bounded thread pool sharing the S3 client.
+put() blocks once max_workers uploads are in flight so queued bodies can't pile up in memory
+'''
+class S3Writer:
+    def __init__(self, bucket: str, max_workers: int = 8, log_level: str = 'INFO'):
+        self.s3 = S3(bucket=bucket, log_level=log_level)
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._in_flight = set()
+        self._uploads = dict()
+        self.failed = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def put(self, key: str, body, ContentType: str = None) -> None:
+        if len(self._in_flight) >= self.max_workers:
+            _, self._in_flight = wait(self._in_flight, return_when=FIRST_COMPLETED)
+        upload = self._executor.submit(self.s3.put_object, key=key, body=body, ContentType=ContentType)
+        self._in_flight.add(upload)
+        self._uploads[key] = upload
+
+    def flush(self) -> list:
+        '''
+        Waits for all pending uploads and returns the keys that failed
+        '''
+        self._executor.shutdown(wait=True)
+        failed = [key for key, upload in self._uploads.items() if upload.exception()]
+        logger.info(f"Uploaded {len(self._uploads) - len(failed)} objects to bucket: {self.s3.bucket}, {len(failed)} failed")
+        self._in_flight.clear()
+        self._uploads.clear()
+        self.failed.extend(failed)
+        return failed
@@ -2,24 +2,118 @@
 import logging
 import os
 import json
-from trp import Document
+from bisect import bisect_left
 
 logger = logging.getLogger(__name__)
 
+# Confidence criteria evaluated by tConf
+WORD = "WORD"
+TABLE = "TABLE"
+CELL = "CELL"
+FORM_KEY = "FORM_KEY"
+FORM_VALUE = "FORM_VALUE"
+CRITERIA = [WORD, TABLE, CELL, FORM_KEY, FORM_VALUE]
+# Block type threshold used for a criterion when the thresholds don't name it
+CRITERIA_BLOCK_TYPES = {WORD: "WORD", TABLE: "TABLE", CELL: "CELL", FORM_KEY: "KEY_VALUE_SET", FORM_VALUE: "KEY_VALUE_SET"}
+
+'''
+Confidence evaluation of a single page of Textract output. The blocks are indexed
+in one pass into an id to block map and the confidence sorted elements per criterion,
+the same elements the trp page model exposes: words of lines, tables, table cells and
+the keys and values of form fields. The trp Document is only built when tDocument
+is used, e.g. for geometry
+'''
 class tConf:
     def __init__(self, j: dict, log_level: str ='INFO'):
         self.json_data=j
-        self.tDoc = Document(j)
-        self.page_num = j["Blocks"][0]["Page"] # assuming j contains only 1 page
+        self._tDoc = None
+        self._page_num = j["Blocks"][0].get("Page", 1) if j.get("Blocks") else 1 # assuming j contains only 1 page
+        self.blocks = {block["Id"]: block for block in j.get("Blocks", [])}
+        self.elements = self._index()
+        self.minimums = {criterion: elements[0][0] for criterion, elements in self.elements.items() if elements}
         logger.setLevel(log_level)
 
+    def _children(self, block: dict, relationship: str = "CHILD"):
+        for rel in block.get("Relationships") or []:
+            if rel["Type"] == relationship:
+                for child_id in rel["Ids"]:
+                    child = self.blocks.get(child_id)
+                    if child is not None:
+                        yield child
+
+    def _index(self) -> dict:
+        elements = {criterion: list() for criterion in CRITERIA}
+
+        def track(criterion: str, block: dict):
+            confidence = block.get("Confidence")
+            if confidence is not None:
+                elements[criterion].append((confidence, block["Id"]))
+
+        for block in self.blocks.values():
+            block_type = block["BlockType"]
+            if block_type == "LINE":
+                for word in self._children(block):
+                    if word["BlockType"] == "WORD":
+                        track(WORD, word)
+            elif block_type == "TABLE":
+                track(TABLE, block)
+                for cell in self._children(block):
+                    if cell["BlockType"] == "CELL":
+                        track(CELL, cell)
+            elif block_type == "KEY_VALUE_SET" and "KEY" in block.get("EntityTypes", []):
+                # like trp, only keys with content make a form field and only values with content count
+                if not any(rel["Type"] == "CHILD" for rel in block.get("Relationships") or []):
+                    continue
+                track(FORM_KEY, block)
+                for value in self._children(block, "VALUE"):
+                    if any(rel["Type"] == "CHILD" for rel in value.get("Relationships") or []):
+                        track(FORM_VALUE, value)
+        for criterion_elements in elements.values():
+            criterion_elements.sort()
+        return elements
+
+    def below(self, criterion: str, confidence_threshold: float) -> bool:
+        return self.minimums.get(criterion, float("inf")) < confidence_threshold
+
+    def evaluate(self, thresholds) -> dict:
+        '''
+        Evaluates every criterion against the index built by the single pass over the page.
+        thresholds is one number for all criteria or a dict keyed by criterion or block type
+        (KEY_VALUE_SET covers form keys and values), criteria without a threshold are skipped.
+        Returns the criteria that tripped and, per evaluated criterion, the threshold, the
+        minimum confidence and the ids of the elements below the threshold, lowest first
+        '''
+        result = {'flagged': False, 'tripped': list(), 'criteria': dict()}
+        for criterion in CRITERIA:
+            if isinstance(thresholds, dict):
+                threshold = thresholds.get(criterion, thresholds.get(CRITERIA_BLOCK_TYPES[criterion]))
+            else:
+                threshold = thresholds
+            if threshold is None:
+                continue
+            elements = self.elements[criterion]
+            below = bisect_left(elements, (threshold,))
+            result['criteria'][criterion] = {'threshold': threshold,
+                                             'minimum': self.minimums.get(criterion),
+                                             'ids': [block_id for _, block_id in elements[:below]]}
+            if below:
+                result['tripped'].append(criterion)
+        result['flagged'] = bool(result['tripped'])
+        logger.debug(f"Page {self.page_num} tripped {result['tripped']}")
+        return result
+
     @property
     def page_num(self):
-        return self.page_num
+        return self._page_num
 
     @property
     def tDocument(self):
-        return self.tDoc
+        if self._tDoc is None:
+            from trp import Document # deferred, trp objects are only needed for geometry
+            self._tDoc = Document(self.json_data)
+        return self._tDoc
+
+    tDoc = tDocument
     
     '''
     Check confidence threshold for WORD and LINE
@@ -38,80 +132,44 @@ class tConf:
     '''
     Check confidence threshold for WORD and LINE
     '''
-    def eval_word_confidence(self, confidence_threshold: float):                         
-        words = []  
-        for page in self.tDoc.pages:
-            # lines and words
-            logger.debug("Evaluating Words...")
-            for line in page.lines:
-                for word in line.words:
-                    if  word.confidence < confidence_threshold:   
-                        logger.debug("Found low score words...")                     
-                        return True
+    def eval_word_confidence(self, confidence_threshold: float):
+        if self.below(WORD, confidence_threshold):
+            logger.debug("Found low score words...")
+            return True
         return False
 
     '''
     Check confidence threshold for TABLE
     '''
     def eval_table_confidence(self, confidence_threshold: float):
-        for page in self.tDoc.pages:        
-            for table in page.tables:
-                if table.confidence < confidence_threshold:  
-                    logger.debug("Found low score table structure...")                            
-                    return True                           
+        if self.below(TABLE, confidence_threshold):
+            logger.debug("Found low score table structure...")
+            return True
         return False
 
     '''
     Check confidence threshold for CELL
     '''
     def eval_cell_confidence(self, confidence_threshold: float):
-        for page in self.tDoc.pages:        
-            for table in page.tables:
-                for r, row in enumerate(table.rows):
-                    for c, cell in enumerate(row.cells):
-                        if cell.confidence < confidence_threshold:  
-                            logger.debug("Found low score cells structure...")                            
-                            return True                           
+        if self.below(CELL, confidence_threshold):
+            logger.debug("Found low score cells structure...")
+            return True
         return False
 
     '''
     Check confidence threshold for FORM Keys
     '''
-    def eval_form_key_confidence(self, confidence_threshold: float):                        
-        for page in self.tDoc.pages:            
-            for field in page.form.fields:
-                if field.key.confidence < confidence_threshold:
-                    logger.debug("Found low score kv pairs in form...")  
-                    '''
-                    this is geo for key-value pair as a whole for highlighting purposes for SMGT CHE.
-                    Key and value level Geos are also available via field.key.geometry.polygon &
-                    field.value.geometry.polygon but is not currently required. 
-                    Available attrubutes
-                    - field.key, field.value --> are the texts for key and values
-                    - field.confidence, field.key.confidence, field.value.confidence
-                    - field.id, field.key.id, field.value.id
-                    - field.geometry, field.key.geometry, field.value.geometry // send key and values
-                    '''                       
-                    return True
+    def eval_form_key_confidence(self, confidence_threshold: float):
+        if self.below(FORM_KEY, confidence_threshold):
+            logger.debug("Found low score kv pairs in form...")
+            return True
         return False
 
     '''
     Check confidence threshold for FORM Values
     '''
-    def eval_form_value_confidence(self, confidence_threshold: float):                        
-        for page in self.tDoc.pages:            
-            for field in page.form.fields:
-                if field.value.confidence < confidence_threshold:
-                    logger.debug("Found low score kv pairs in form...")  
-                    '''
-                    this is geo for key-value pair as a whole for highlighting purposes for SMGT CHE.
-                    Key and value level Geos are also available via field.key.geometry.polygon &
-                    field.value.geometry.polygon but is not currently required. 
-                    Available attrubutes
-                    - field.key, field.value --> are the texts for key and values
-                    - field.confidence, field.key.confidence, field.value.confidence
-                    - field.id, field.key.id, field.value.id
-                    - field.geometry, field.key.geometry, field.value.geometry // send key and values
-                    '''
-                    return True
-        return False
\ No newline at end of file
+    def eval_form_value_confidence(self, confidence_threshold: float):
+        if self.below(FORM_VALUE, confidence_threshold):
+            logger.debug("Found low score kv pairs in form...")
+            return True
+        return False
@@ -0,0 +1,137 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import logging
+import struct
+
+logger = logging.getLogger(__name__)
+
+# Size in bytes of one value of each TIFF field type
+FIELD_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+SHORT = 3
+LONG = 4
+
+COMPRESSION = 259
+OLD_JPEG = 6
+# Image data location tags, (offsets tag, byte counts tag) for strips and tiles
+STRIPS = (273, 279)
+TILES = (324, 325)
+# Tags pointing at other IFDs or data outside the image data, not carried into single frame files
+DROPPED_TAGS = {330, 513, 514, 34665, 34853, 40965}
+
+'''
+Index of the frames (IFDs) of a multi-page TIFF, built with a single walk of the
+IFD chain. Any frame can then be written out as a single page TIFF by copying
+its compressed strips or tiles as they are, without decoding earlier frames or
+recompressing the image. Raises ValueError for files it can't copy through
+(BigTIFF, old-style JPEG), callers fall back to Pillow for those
+'''
+class TiffIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            header = self._file.read(8)
+            if header[:2] not in (b'II', b'MM'):
+                raise ValueError(f"{path} is not a TIFF file")
+            self._byte_order = header[:2]
+            self._order = '<' if header[:2] == b'II' else '>'
+            magic, offset = struct.unpack(self._order + 'HI', header[2:8])
+            if magic != 42:
+                raise ValueError(f"{path} is not a classic TIFF file (magic {magic})")
+            self.frames = self._read_ifds(offset)
+        except Exception:
+            self._file.close()
+            raise
+        logger.debug(f"Indexed {len(self.frames)} frames of {path}")
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def _read_ifds(self, offset: int) -> list:
+        frames = list()
+        visited = set()
+        while offset and offset not in visited:
+            visited.add(offset)
+            self._file.seek(offset)
+            count = struct.unpack(self._order + 'H', self._file.read(2))[0]
+            raw_entries = self._file.read(12 * count)
+            offset = struct.unpack(self._order + 'I', self._file.read(4))[0]
+            entries = dict()
+            for i in range(count):
+                tag, field_type, values = struct.unpack(self._order + 'HHI', raw_entries[12 * i:12 * i + 8])
+                if field_type not in FIELD_SIZES:
+                    continue
+                size = FIELD_SIZES[field_type] * values
+                if size <= 4:
+                    raw = raw_entries[12 * i + 8:12 * i + 8 + size]
+                else:
+                    self._file.seek(struct.unpack(self._order + 'I', raw_entries[12 * i + 8:12 * i + 12])[0])
+                    raw = self._file.read(size)
+                entries[tag] = (field_type, values, raw)
+            frames.append(self._validate(entries, len(frames)))
+        return frames
+
+    def _numbers(self, entry: tuple) -> tuple:
+        field_type, values, raw = entry
+        return struct.unpack(self._order + ('H' if field_type == SHORT else 'I') * values, raw)
+
+    def _validate(self, entries: dict, index: int) -> dict:
+        if COMPRESSION in entries and self._numbers(entries[COMPRESSION])[0] == OLD_JPEG:
+            raise ValueError(f"Frame {index} of {self.path} uses old-style JPEG compression")
+        layout = STRIPS if STRIPS[0] in entries else TILES
+        if layout[0] not in entries or layout[1] not in entries:
+            raise ValueError(f"Frame {index} of {self.path} has no image data location")
+        if entries[layout[0]][1] != entries[layout[1]][1]:
+            raise ValueError(f"Frame {index} of {self.path} has mismatched image data offsets and byte counts")
+        return entries
+
+    def frame(self, index: int) -> bytes:
+        '''
+        Returns frame index (0 based) as a single page TIFF with the original compressed image data
+        '''
+        entries = self.frames[index]
+        offsets_tag, counts_tag = STRIPS if STRIPS[0] in entries else TILES
+        offsets = self._numbers(entries[offsets_tag])
+        counts = self._numbers(entries[counts_tag])
+
+        tags = sorted(tag for tag in entries if tag not in DROPPED_TAGS)
+        values = {tag: entries[tag] for tag in tags}
+        # offsets are rewritten as LONGs once the new data positions are known
+        values[offsets_tag] = (LONG, len(offsets), bytes(4 * len(offsets)))
+
+        position = 8 + 2 + 12 * len(tags) + 4
+        value_positions = dict()
+        for tag in tags:
+            size = len(values[tag][2])
+            if size > 4:
+                position += position % 2 # values start on a word boundary
+                value_positions[tag] = position
+                position += size
+        data_positions = list()
+        for count in counts:
+            position += position % 2
+            data_positions.append(position)
+            position += count
+        values[offsets_tag] = (LONG, len(offsets), struct.pack(self._order + 'I' * len(offsets), *data_positions))
+
+        out = bytearray(position)
+        out[0:8] = self._byte_order + struct.pack(self._order + 'HI', 42, 8)
+        out[8:10] = struct.pack(self._order + 'H', len(tags))
+        for i, tag in enumerate(tags):
+            field_type, count, raw = values[tag]
+            entry = 10 + 12 * i
+            out[entry:entry + 8] = struct.pack(self._order + 'HHI', tag, field_type, count)
+            if tag in value_positions:
+                out[entry + 8:entry + 12] = struct.pack(self._order + 'I', value_positions[tag])
+                out[value_positions[tag]:value_positions[tag] + len(raw)] = raw
+            else:
+                out[entry + 8:entry + 8 + len(raw)] = raw
+        # next IFD offset stays 0, the file has a single frame
+        for offset, count, data_position in zip(offsets, counts, data_positions):
+            self._file.seek(offset)
+            out[data_position:data_position + count] = self._file.read(count)
+        return bytes(out)
+
+    def close(self) -> None:
+        self._file.close()
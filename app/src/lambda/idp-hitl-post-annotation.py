@@ -2,30 +2,32 @@
 # SPDX-License-Identifier: MIT-0
 import os
 import json
+import time
 import logging
-import boto3
-from boto3.dynamodb.types import TypeDeserializer
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from Clients import get_client
 from S3Functions import S3
+from JsonStream import JsonStream
 
 
 logger = logging.getLogger(__name__)
 
-s3 = boto3.resource('s3')
-snsClient = boto3.client('sns')
-ddb = boto3.client('dynamodb')
-deserializer = TypeDeserializer()
-
 _sns_topic_arn =  os.environ.get('ALL_PAGES_COMPLETE_SNS_TOPIC_ARN')
 _tracking_table = os.environ.get('SMGT_DYNAMO_TABLE_NAME')
-
-
-dbDynoSelect = f"SELECT pages_sent FROM \"{_tracking_table}\" WHERE job_id=?"
-dbDynoUpdate = f"UPDATE \"{_tracking_table}\" SET pages_sent=? WHERE job_id=?"
+_log_level = os.environ.get('LOG_LEVEL', 'INFO')
+# Number of answer files read concurrently and the number of JobIds kept in the cache
+_fetch_workers = int(os.environ.get('ANSWER_FETCH_WORKERS', 8))
+_job_id_cache_size = int(os.environ.get('JOB_ID_CACHE_SIZE', 10000))
+_job_ids = dict()
+# Delete the per page Textract results once every page of a job has been reviewed
+_delete_results_on_complete = os.environ.get('DELETE_RESULTS_ON_COMPLETE', 'false').lower() == 'true'
+# CloudWatch namespace of the consolidation success and failure metrics
+_metrics_namespace = os.environ.get('CONSOLIDATION_METRICS_NAMESPACE', 'IDP-HITL')
 
 
 def lambda_handler(event, context):
-    logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+    logger.setLevel(_log_level)
     logger.info(json.dumps(event))
 
     try:
@@ -46,35 +48,37 @@ def lambda_handler(event, context):
 
         returnAnnots = do_consolidation(labeling_job_arn, payload, label_attribute_name)
         
-        """Enumerate over annotations and delete each file assoicated with annotations and update by decrementing DynmoDB table tracking pages"""
-        for p in range(len(returnAnnots)):
-
-            inputKey = json.loads(returnAnnots[p]['consolidatedAnnotation']['content']['idp']['annotationsFromAllWorkers'][0]['annotationData']['content'])['inputPrefix'] + '/page/' + json.loads(returnAnnots[p]['consolidatedAnnotation']['content']['idp']['annotationsFromAllWorkers'][0]['annotationData']['content'])['inputFiles'][0]
-            outputKey = json.loads(returnAnnots[p]['consolidatedAnnotation']['content']['idp']['annotationsFromAllWorkers'][0]['annotationData']['content'])['answerPrefix'] + '/' + json.loads(returnAnnots[p]['consolidatedAnnotation']['content']['idp']['annotationsFromAllWorkers'][0]['annotationData']['content'])['answerFiles'][0]
-            jobId =getJobIdfromJSON(bucket,outputKey)
-
+        """Parse each annotation once and look up the Textract JobIds of the whole batch at once"""
+        reviews = [parseAnnotation(annotation) for annotation in returnAnnots]
+        jobIds = getJobIds(bucket, reviews)
+
+        """Enumerate over annotations and collect the files assoicated with annotations, counting the reviewed pages per job"""
+        reviewedPages = {}
+        inputKeys = {}
+        for review, jobId in zip(reviews, jobIds):
             if len(jobId) == 0:
                     logger.error("Unable to find textract JobId in JSON SMGT output")
-                    logger.info('No job ID found, exiting - returning')
+                    logger.info('No job ID found, skipping annotation')
+                    continue
         
-            # go get pages left with the job ID from DynamoDB
-            pagesLeft = getPDFPagesLeft(jobId)
-
-            # decrement pages left and update row in DynamoDB, then delete PDF page from S3
-            pagesLeft -= 1
-            logger.info(str(pagesLeft) + '-- Pages left')
-            updatetPDFPagesLeft(jobId,pagesLeft) 
+            reviewedPages[jobId] = reviewedPages.get(jobId, 0) + 1
+            inputKeys.setdefault(jobId, []).append(review['inputKey'])
         
-            logger.info('Deleting PDF page')
-            deletePDFPage(jobId, inputKey)
+        logger.info('Deleting PDF pages')
+        deletePDFPages([inputKey for keys in inputKeys.values() for inputKey in keys])
 
+        """Decrement the pages left of each job in DynamoDB with one atomic update per job"""
+        for jobId in decrementPagesLeft(reviewedPages):
             # notify customer via SNS topic that job review has been completed
-            if pagesLeft == 0 :
-                logger.info('Sending SNS notification')
-                sendSNSPagesComplete(jobId)
+            logger.info('Sending SNS notification')
+            sendSNSPagesComplete(jobId)
+            if _delete_results_on_complete:
+                deleteTextractResults(inputKeys[jobId][0])
     
 
-        logger.info('Exiting - Returning ' + json.dumps(returnAnnots))
+        logger.info(f"Exiting - Returning {len(returnAnnots)} annotations")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(returnAnnots))
         return returnAnnots
     except Exception as e:
         logger.error("Unable to run post annotation clean up")
@@ -82,6 +86,29 @@ def lambda_handler(event, context):
         return ""
 
 
+def parseAnnotation(annotation):
+    # annotationData content is a JSON string, it is decoded once per annotation
+    content = json.loads(annotation['consolidatedAnnotation']['content']['idp']['annotationsFromAllWorkers'][0]['annotationData']['content'])
+    return {
+        'inputKey': content['inputPrefix'] + '/page/' + content['inputFiles'][0],
+        'answerPrefix': content['answerPrefix'],
+        'outputKey': content['answerPrefix'] + '/' + content['answerFiles'][0]
+    }
+
+
+# Job IDs of answer prefixes already read, kept across warm invocations
+def getJobIds(bucket, reviews):
+    missing = {review['answerPrefix']: review['outputKey'] for review in reviews if (bucket, review['answerPrefix']) not in _job_ids}
+    if missing:
+        if len(_job_ids) + len(missing) > _job_id_cache_size:
+            _job_ids.clear()
+        with ThreadPoolExecutor(max_workers=_fetch_workers) as executor:
+            for answerPrefix, jobId in zip(missing, executor.map(lambda key: getJobIdfromJSON(bucket, key), missing.values())):
+                if jobId:
+                    _job_ids[(bucket, answerPrefix)] = jobId
+    return [_job_ids.get((bucket, review['answerPrefix']), "") for review in reviews]
+
+
 # Job ID is located in JSON file that contains the annotations. Fist we need to load the meta file
 # found under consolidation-request location, then from here we can find the location to the JSON file
 # that contains the annotation output and the Job ID.
@@ -90,8 +117,7 @@ def lambda_handler(event, context):
 def getJobIdfromJSON(bucket, answerKey):
     try:
 
-        obj = s3.Object(bucket, answerKey)
-        texttactAnnotation = obj.get()['Body'].read().decode('utf-8')
+        texttactAnnotation = S3(bucket=bucket, log_level=_log_level).get_object_content(key=answerKey).decode('utf-8')
         jobId = json.loads(texttactAnnotation)['JobId']
 
 
@@ -102,51 +128,72 @@ def getJobIdfromJSON(bucket, answerKey):
         logger.error(e)
         return ""
 
-def getPDFPagesLeft(jobId):
-    try:
-        ddbresponse = ddb.execute_statement(Statement=dbDynoSelect, Parameters=[
-                                                                    {'S': f"{jobId}"}])                                         
-        
-        deserialized_document = {k: deserializer.deserialize(v) for k, v in ddbresponse['Items'][0].items()}
-        pagesLeft = int(deserialized_document['pages_sent'])
-    except Exception as e:
-        logger.error(e)
-        return 1
-
-    return pagesLeft
-
+# Applies one atomic ADD per job for all pages of the batch. The update returns the new
+# counter so only the update that brings pages left to zero completes the job, concurrent
+# consolidation batches can't lose decrements or complete a job twice. Fan-out jobs only
+# complete once all workers are done.
+def decrementPagesLeft(reviewedPages):
+    completed = []
+    ddb = get_client('dynamodb')
+    for jobId, pages in reviewedPages.items():
+        try:
+            ddbresponse = ddb.update_item(TableName=_tracking_table,
+                                          Key={'job_id': {'S': f"{jobId}"}},
+                                          UpdateExpression="ADD pages_sent :reviewed",
+                                          ConditionExpression="attribute_exists(job_id)",
+                                          ExpressionAttributeValues={':reviewed': {'N': f"{-pages}"}},
+                                          ReturnValues='ALL_NEW')
+            pagesLeft = int(ddbresponse['Attributes']['pages_sent']['N'])
+            workersPending = int(ddbresponse['Attributes'].get('workers_pending', {'N': '0'})['N'])
+            logger.info(f"{pagesLeft}-- Pages left for job {jobId}")
+            if pagesLeft <= 0 < pagesLeft + pages and workersPending == 0:
+                completed.append(jobId)
+        except Exception as e:
+            logger.error("Unable to update pages left count for job ID in DynamoDB")
+            logger.error(e)
+    return completed
+
+
+def deletePDFPages(inputS3Objects):
+# Delete generated PDF or Image pages of the whole batch from S3 with bulk deletes per bucket
+    keysByBucket = {}
+    for inputS3Object in inputS3Objects:
+        s3UrlParse = urlparse(inputS3Object, allow_fragments=False)
+        keysByBucket.setdefault(s3UrlParse.netloc, []).append(s3UrlParse.path.lstrip('/'))
 
-def updatetPDFPagesLeft(jobId, page_left):
-    try:
-        ddbresponse = ddb.execute_statement(Statement=dbDynoUpdate, Parameters=[
-                                                                    {'N': f"{page_left}"},
-                                                                    {'S': f"{jobId}"}])  
-    except Exception as e:
-        logger.error("Unable to update pages left count for job ID in DynamoDB")
-        logger.error(e)
+    failed = []
+    for bucket, keys in keysByBucket.items():
+        try:
+            response = S3(bucket=bucket, log_level=_log_level).delete_objects(keys)
+            failed.extend(f"s3://{bucket}/{error.get('Key')}" for error in response['Errors'])
+            logger.info(f"{len(response['Deleted'])} pages -- Sucessfully deleted from {bucket}")
+        except Exception as e:
+            logger.error("Unable to delete single PDF/TIFF pages that were generated for GroundTruth.")
+            logger.error(e)
+            failed.extend(f"s3://{bucket}/{key}" for key in keys)
 
+    if failed:
+        logger.error(f"Unable to delete generated pages {failed}")
+    return failed
 
 
-def deletePDFPage(jobId, inputS3Object):
-# Delete generated PDF or Image page from S3
+def deleteTextractResults(inputS3Object):
+# Delete the per page Textract results of a completed job, reviewer answers are kept
     try:
         s3UrlParse = urlparse(inputS3Object, allow_fragments=False)
-        bucket = s3UrlParse.netloc
-        basePathtoGeneratePage = s3UrlParse.path.lstrip('/')
-        s3.Object(bucket, basePathtoGeneratePage).delete()
-        logger.info(basePathtoGeneratePage + '-- Sucessfully deleted')
-
+        jobPrefix = s3UrlParse.path.lstrip('/').rsplit('/pages/', 1)[0]
+        s3Client = S3(bucket=s3UrlParse.netloc, log_level=_log_level)
+        results = s3Client.list_objects(prefix=f"{jobPrefix}/pages/", search=['/textract-result/'])
+        s3Client.delete_objects(results)
     except Exception as e:
-        logger.error("Unable to delete single PDF/TIFF pages that were generated for GroundTruth.")
+        logger.error("Unable to delete Textract page results of completed job.")
         logger.error(e)
 
-    return
-
 def sendSNSPagesComplete(jobId):
     
     # with all pages now reviewed from Job, sent notification to customer
     try:
-        snsClient.publish(
+        get_client('sns').publish(
             TopicArn=_sns_topic_arn,
             Message=f"Job {jobId} has completed reviewing all sent pages.",
             Subject="Job Complete"
@@ -158,46 +205,40 @@ def sendSNSPagesComplete(jobId):
     
     return
 
-def do_consolidation(labeling_job_arn, payload, label_attribute_name):
+def iter_payload(payload):
+    """
+        Yields the data objects of the payload one at a time. A payload passed by reference
+        (s3Uri) is parsed incrementally from the S3 body instead of being loaded as a whole
+    """
+    if "s3Uri" not in payload:
+        yield from payload
+        return
+
+    s3UrlParse = urlparse(payload["s3Uri"], allow_fragments=False)
+    body = S3(bucket=s3UrlParse.netloc, log_level=_log_level).get_object_stream(key=s3UrlParse.path.lstrip('/'))
+    try:
+        yield from JsonStream(body).iter_array()
+    finally:
+        body.close()
+
+
+def iter_consolidation(labeling_job_arn, payload, label_attribute_name, metrics):
     """
-        Core Logic for consolidation
+        Core Logic for consolidation, yields the consolidation response of each data object
+        as soon as it is read and counts successes and failures in metrics
 
     :param labeling_job_arn: labeling job ARN
     :param payload:  payload data for consolidation
     :param label_attribute_name: identifier for labels in output JSON
-    :param s3_client: S3 helper class
-    :return: output JSON string
+    :param metrics: dict receiving the success and failure counts
     """
 
-    # Extract payload data
-    if "s3Uri" in payload:
-        s3_ref = payload["s3Uri"]
-        path_parts = s3_ref.replace("s3://", "").split("/")
-        bucket = path_parts.pop(0)
-        keyObjName = "/".join(path_parts)
-
-        s3_object = s3.Object(bucket_name=bucket, key=keyObjName)
-        
-        payload = json.loads(s3_object.get().get('Body').read().decode('utf-8'))
-
-
     # Payload data contains a list of data objects.
     # Iterate over it to consolidate annotations for individual data object.
-    consolidated_output = []
-    success_count = 0  # Number of data objects that were successfully consolidated
-    failure_count = 0  # Number of data objects that failed in consolidation
-
-    for p in range(len(payload)):
-        response = None
+    for p, data_object in enumerate(iter_payload(payload)):
         try:
-            dataset_object_id = payload[p]['datasetObjectId']
-            log_prefix = "[{}] data object id [{}] :".format(labeling_job_arn, dataset_object_id)
-            #print("{} Consolidating annotations BEGIN ".format(log_prefix))
-
-            annotations = payload[p]['annotations']
-            #print("{} Received Annotations from all workers {}".format(log_prefix, annotations))
-
- 
+            dataset_object_id = data_object['datasetObjectId']
+            annotations = data_object['annotations']
 
             # Notice that, no consolidation is performed, worker responses are combined and appended to final output
             # You can put your consolidation logic here
@@ -213,19 +254,46 @@ def do_consolidation(labeling_job_arn, payload, label_attribute_name):
                 }
             }
 
-            success_count += 1
-            #print("{} Consolidating annotations END ".format(log_prefix))
-
-            # Append individual data object response to the list of responses.
-            if response is not None:
-                consolidated_output.append(response)
+        except Exception as e:
+            metrics['failure_count'] += 1
+            logger.error(f"[{labeling_job_arn}] Consolidation failed for dataobject {p}: {e}")
+            continue
+
+        metrics['success_count'] += 1
+        yield response
+
+
+def put_consolidation_metrics(labeling_job_arn, metrics):
+    # CloudWatch embedded metric format, printed as a bare JSON line so Lambda logs turn it into metrics
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": _metrics_namespace,
+                "Dimensions": [["LabelingJobArn"]],
+                "Metrics": [{"Name": "ConsolidationSuccess", "Unit": "Count"},
+                            {"Name": "ConsolidationFailure", "Unit": "Count"}]
+            }]
+        },
+        "LabelingJobArn": labeling_job_arn,
+        "ConsolidationSuccess": metrics['success_count'],
+        "ConsolidationFailure": metrics['failure_count']
+    }))
 
-        except:
-            failure_count += 1
-            print(" Consolidation failed for dataobject {}".format(p))
 
-    #print("Consolidation Complete. Success Count {}  Failure Count {}".format(success_count, failure_count))
+def do_consolidation(labeling_job_arn, payload, label_attribute_name):
+    """
+        Consolidates every data object of the payload
 
+    :param labeling_job_arn: labeling job ARN
+    :param payload:  payload data for consolidation
+    :param label_attribute_name: identifier for labels in output JSON
+    :return: list of consolidation responses
+    """
+    metrics = {'success_count': 0, 'failure_count': 0}
+    consolidated_output = list(iter_consolidation(labeling_job_arn, payload, label_attribute_name, metrics))
+    logger.info(f"Consolidation Complete. Success Count {metrics['success_count']}  Failure Count {metrics['failure_count']}")
+    put_consolidation_metrics(labeling_job_arn, metrics)
 
     return consolidated_output
 
@@ -1,132 +1,307 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import os
-import boto3
 import json
 import time
+import io
+import itertools
 import logging
-import mimetypes
-from S3Functions import S3
+import shutil
+import tempfile
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from Clients import get_client
+from ConfigCache import ConfigCache
+from S3Functions import S3, S3Writer
 from Manifests import tManifest
-from pypdf import PdfReader, PdfWriter
-from PIL import Image
+from JsonStream import JsonStream
+from DocumentCache import DocumentCache, PDF_MIME, PNG_MIME, JPG_MIME, TIF_MIME
+from PageExtractor import PageExtractor
+from Renditions import Renditioner, RENDITION_FORMATS
+from RegionCrops import plan_regions, region_area, region_blocks, region_report, CROP_EXTENSION
+from ConfidenceScores import BlockArrays, parse_thresholds
+from FanOut import part_boundaries, plan_work_items, LambdaExecutor, LocalExecutor
 
-# Mime types for Amazon Textract supported file formats
-PDF_MIME='application/pdf'
-PNG_MIME='image/png'
-JPG_MIME='image/jpeg'
-TIF_MIME='image/tiff'
+# SNS publish_batch limits
+SNS_BATCH_ENTRIES = 10
+SNS_BATCH_BYTES = 262144
 
 # Initialize environment variables
 _gt_sns_topic = os.environ.get('GT_SNS_TOPIC_ARN')
 _confidence_thresh_ssm = os.environ.get('THRESHOLD_SSM')
 _tracking_table = os.environ.get('TEXTRACT_GT_TABLE')
 _kms_key = os.environ.get('BUCKET_KMS_KEY')
+_complete_sns_topic = os.environ.get('ALL_PAGES_COMPLETE_SNS_TOPIC_ARN')
 log_level = os.environ.get('LOG_LEVEL', 'INFO')
+# Parse Textract output parts incrementally so memory is bounded by one page instead of one part
+_stream_output = os.environ.get('TEXTRACT_STREAM_OUTPUT', 'false').lower() == 'true'
+# Number of Textract output parts downloaded ahead of the one being processed, 0 disables prefetching
+_prefetch_parts = int(os.environ.get('TEXTRACT_PREFETCH_PARTS', 2))
+# In streaming mode prefetched parts are spooled, parts above this many MB are kept in Lambda /tmp instead of memory
+_prefetch_spool_bytes = int(os.environ.get('TEXTRACT_PREFETCH_SPOOL_MB', 8)) * 1024 * 1024
+# Number of concurrent uploads of extracted pages
+_upload_workers = int(os.environ.get('PAGE_UPLOAD_WORKERS', 8))
+# Which page Textract results are written to S3: flagged (only the pages sent for review, the reviewer
+# UI reads them) or all pages. Flagged pages are always written
+_write_policy = os.environ.get('PAGE_RESULT_WRITE_POLICY', 'flagged').lower()
+if _write_policy not in ('flagged', 'all'):
+    raise Exception(f"Un-supported PAGE_RESULT_WRITE_POLICY {_write_policy}, expected flagged or all")
+# Number of concurrent SNS publish_batch calls and retries of failed entries
+_publish_workers = int(os.environ.get('GT_PUBLISH_WORKERS', 4))
+_publish_retries = int(os.environ.get('GT_PUBLISH_RETRIES', 3))
+# Fan-out mode, split jobs into page ranges of this many pages processed by separate invocations, 0 disables
+_fanout_pages = int(os.environ.get('FANOUT_PAGES_PER_WORKER', 0))
+# Seconds a fan-out worker holds the claim of its page range, at least the function timeout. A retried
+# worker re-claims a range whose claim has expired and that was never finished
+_claim_lease = int(os.environ.get('FANOUT_CLAIM_LEASE_SECONDS', 900))
+# Runs the fan-out workers as Lambda invocations (lambda) or in process for local testing (local)
+_fanout_executor = os.environ.get('FANOUT_EXECUTOR', 'lambda').lower()
+# Maximum number of low confidence elements listed in the confidence report of a page
+_report_max_elements = int(os.environ.get('REPORT_MAX_ELEMENTS', 100))
+# Web preview of each page for the reviewer UI: none, webp or jpeg, at most this many dots per inch,
+# with this encoder quality and cut into square tiles of this many pixels (0 disables tiles)
+_rendition_format = os.environ.get('PAGE_RENDITION_FORMAT', 'none').lower()
+if _rendition_format != 'none' and _rendition_format not in RENDITION_FORMATS:
+    raise Exception(f"Un-supported PAGE_RENDITION_FORMAT {_rendition_format}, expected none or one of {list(RENDITION_FORMATS)}")
+_rendition_max_dpi = int(os.environ.get('PAGE_RENDITION_MAX_DPI', 150))
+_rendition_quality = int(os.environ.get('PAGE_RENDITION_QUALITY', 80))
+_rendition_tile_size = int(os.environ.get('PAGE_RENDITION_TILE_SIZE', 0))
+# Review mode: page sends every flagged page as one task, region sends padded crops of the low confidence
+# regions as separate tasks. Regions closer than REGION_MERGE_GAP are merged (both relative to the page),
+# pages with more than REGION_MAX_COUNT regions or crops covering more than REGION_MAX_AREA are sent whole
+_review_mode = os.environ.get('REVIEW_MODE', 'page').lower()
+_region_padding = float(os.environ.get('REGION_PADDING', 0.01))
+_region_merge_gap = float(os.environ.get('REGION_MERGE_GAP', 0.02))
+_region_max_count = int(os.environ.get('REGION_MAX_COUNT', 10))
+_region_max_area = float(os.environ.get('REGION_MAX_AREA', 0.5))
+# Number of SNS records (Textract jobs) of one invocation processed concurrently, every job also runs
+# its own upload, prefetch and publish pools so AWS_MAX_POOL_CONNECTIONS should grow with it
+_record_workers = int(os.environ.get('RECORD_WORKERS', 4))
+# Seconds the confidence thresholds read from SSM are reused before they are read again
+_threshold_ttl = float(os.environ.get('THRESHOLD_CACHE_TTL', 300))
 
 logger = logging.getLogger(__name__)
-ssm = boto3.client('ssm')
-sns = boto3.client('sns')
-ddb = boto3.client('dynamodb')
-
-'''
-Writes file to S3 (probably move this to S3Functions)
-'''
-def write_to_s3(data, bucket, key)  -> None: 
-    client = boto3.client('s3')               
-    client.put_object(Body=json.dumps(data),
-                  Bucket=bucket,
-                  Key=key)
-
-def extract_page(**kwargs) -> dict:
+_config = ConfigCache(ttl=_threshold_ttl, log_level=log_level)
+
+def extract_pages(**kwargs) -> dict:
+    '''
+    Extracts the flagged pages and returns the task fields per page number, one task for
+    a whole page or one per region for pages reviewed as regions
+    '''
     doc_s3 = kwargs["doc_s3"]
     doc = kwargs["doc"]    
     bucket = kwargs['bucket']
     prefix = kwargs['prefix']
-    page_num=kwargs["page_num"]
+    page_nums = kwargs["page_nums"]
+    regions = kwargs.get("regions")
+    documents = DocumentCache(log_level=log_level)
     try:
         '''
-        Download the document into Lambda /tmp to find the mime type
+        Get the source document from the document cache, it is downloaded into
+        Lambda /tmp and opened only once for all pages of the document
         '''
-        filename = os.path.basename(doc)
-        temp_file = f'/tmp/{filename}'
-        logger.info("Downloading document to /tmp/")
-        s3_client = S3(bucket=doc_s3, log_level=log_level)
-        s3_client.download_file(source_object=doc, destination_file=temp_file)
-
-        file_mime = mimetypes.guess_type(temp_file, strict=True)[0]
-        file_extension = mimetypes.guess_all_extensions(file_mime, strict=True)[0]
-        logger.debug(f"File mime type is {file_mime} and extension is {file_extension}")
-
-        s3_doc_client = S3(bucket=bucket, log_level=log_level)        
-        destination_prefix = f"{prefix}/pages/{page_num}/page/{page_num}{file_extension}"
-
-        # Handle image files
-        if file_mime in [PNG_MIME, JPG_MIME]:            
-            s3_doc_client.upload_file(source_file=temp_file, 
-                                      destination_object=destination_prefix, 
-                                      ExtraArgs={'ContentType': file_mime})                                
-        # Handle PDF files
-        elif file_mime == PDF_MIME:
-            reader = PdfReader(temp_file)
-            writer = PdfWriter()
-            writer.add_page(reader.pages[page_num - 1]) # Extract the specific page
-            with open(f"/tmp/{page_num}.pdf", "wb") as out:
-                writer.write(out)
-            s3_doc_client.upload_file(source_file=f"/tmp/{page_num}{file_extension}", 
-                                      destination_object=destination_prefix, 
-                                      ExtraArgs={'ContentType': file_mime})                             
-        # Handle TIF files
-        elif file_mime == TIF_MIME:
-            img = Image.open(temp_file)
-            img.seek(page_num - 1)
-            img.save(f"/tmp/{page_num}{file_extension}")
-            s3_doc_client.upload_file(source_file=f"/tmp/{page_num}{file_extension}", 
-                                      destination_object=destination_prefix, 
-                                      ExtraArgs={'ContentType': file_mime})            
-        else:
-            logger.error(f"Un-supported file type {file_mime} for s3://{doc_s3}/{doc}")
-            raise Exception(f"Un-supported file type {file_mime} for s3://{doc_s3}/{doc}")
-        
-        os.remove(temp_file)     
-        logger.debug(f"Page {page_num}{file_extension} written into {destination_prefix}")
-        return {'source': f'Amazon Textract review document {filename} page number {page_num}',
-                'fileExtension': file_extension, 
-                'inputS3Prefix': f"s3://{bucket}/{prefix}/pages/{page_num}",
-                'outputS3Prefix': f"s3://{bucket}/{prefix}/pages/{page_num}",
-                'currPageNumber': page_num,
-                'numberOfPages': 1}
+        document = documents.get(doc_s3, doc)
+        if document.mime not in [PNG_MIME, JPG_MIME, PDF_MIME, TIF_MIME]:
+            logger.error(f"Un-supported file type {document.mime} for s3://{doc_s3}/{doc}")
+            raise Exception(f"Un-supported file type {document.mime} for s3://{doc_s3}/{doc}")
+
+        renditioner = None
+        if _rendition_format != 'none':
+            renditioner = Renditioner(image_format=_rendition_format, max_dpi=_rendition_max_dpi,
+                                      quality=_rendition_quality, tile_size=_rendition_tile_size)
+        extractor = PageExtractor(document, bucket=bucket, prefix=prefix, max_workers=_upload_workers, log_level=log_level,
+                                  renditioner=renditioner)
+        extracted = extractor.extract_pages(page_nums, regions=regions)
+        pages = dict()
+        for page_num, destination_prefix in extracted.items():
+            logger.debug(f"Page {page_num}{document.extension} written into {destination_prefix}")
+            page = {'source': f'Amazon Textract review document {document.filename} page number {page_num}',
+                    'fileExtension': document.extension, 
+                    'inputS3Prefix': f"s3://{bucket}/{prefix}/pages/{page_num}",
+                    'outputS3Prefix': f"s3://{bucket}/{prefix}/pages/{page_num}",
+                    'currPageNumber': page_num,
+                    'numberOfPages': 1}
+            # the original stays at inputS3Prefix as the fallback of the rendition
+            page.update(extractor.renditions.get(page_num, {}))
+            pages[page_num] = [page]
+        for page_num, page_regions in extractor.regions.items():
+            logger.debug(f"{len(page_regions)} regions of page {page_num} written into {prefix}/pages/{page_num}/regions")
+            pages[page_num] = [{'source': f'Amazon Textract review document {document.filename} page number {page_num} region {index + 1} of {len(page_regions)}',
+                                'fileExtension': CROP_EXTENSION,
+                                'inputS3Prefix': f"s3://{bucket}/{extractor.region_prefix(page_num, index)}",
+                                'outputS3Prefix': f"s3://{bucket}/{extractor.region_prefix(page_num, index)}",
+                                'currPageNumber': page_num,
+                                'numberOfPages': 1,
+                                'confidenceReport': region_report(region),
+                                # where the crop lies on the page, page relative
+                                'region': {'boundingBox': region['boundingBox'], 'index': index, 'count': len(page_regions)}}
+                               for index, region in enumerate(page_regions)]
+        return pages
         
     except Exception as e:
         logger.error(e)
         raise Exception(e)
+    finally:
+        # source documents are only kept while the pages of this job are extracted
+        documents.clear()
 
-def check_confidence(schema, threshold, doc_s3, doc, bucket, prefix, job_id, page_num) -> dict:
-    low_confidence = False
-    response = {}
+def get_thresholds() -> dict:
+    '''
+    Per block type confidence thresholds from SSM, cached for THRESHOLD_CACHE_TTL seconds
+    '''
+    return _config.get(_confidence_thresh_ssm, parse=parse_thresholds)
 
-    logger.info(f"Writing {page_num}.json file to S3")
-    write_to_s3(schema.toJson, bucket, f"{prefix}/pages/{page_num}/textract-result/{page_num}.json")
+def check_confidence(schema, thresholds, writer, prefix, job_id, page_num) -> dict:
+    response = {}
 
     logger.info(f"Checking confidence scores for page {page_num} for Textract JobId {job_id}")
-    for p_block in schema.blocks:
-        if p_block.get('BlockType') != "PAGE": #PAGE doesn't have confidence score
-            if p_block.get('Confidence') < threshold and p_block.get('BlockType') in ["WORD", "TABLE", "CELL", "MERGED_CELL", "KEY_VALUE_SET", "SIGNATURE"]:
-                low_confidence = True
-                break    
-
-    if low_confidence:
-        logger.info(f"Found low scores in page {page_num}, extracting page")
-        response = extract_page(doc_s3=doc_s3, 
-                                doc=doc,                                                 
-                                bucket=bucket, 
-                                prefix=prefix, 
-                                page_num=page_num)
+    scores = BlockArrays(schema.blocks)
+    # block types without a threshold are not reviewed so they never flag a page
+    low_blocks = scores.low_confidence(thresholds)
+
+    if low_blocks or _write_policy == 'all':
+        logger.info(f"Writing {page_num}.json file to S3")
+        writer.put(key=f"{prefix}/pages/{page_num}/textract-result/{page_num}.json", 
+                   body=schema.toBytes())
+
+    if low_blocks:
+        report = scores.report(low_blocks, max_elements=_report_max_elements)
+        logger.info(f"Found low scores in page {page_num} {report['counts']}, page queued for extraction")
+        response['currPageNumber'] = page_num
         response['outputKmsKeyId'] = _kms_key
         response['textractJobId'] = job_id
-        response['configuration'] = { 'defaultConfidenceThreshold': threshold }
+        response['configuration'] = { 'defaultConfidenceThreshold': min(thresholds.values()),
+                                      'confidenceThresholds': thresholds }
+        response['confidenceReport'] = report
+        if _review_mode == 'region':
+            regions = review_regions(scores, low_blocks)
+            if regions:
+                logger.info(f"Page {page_num} is reviewed as {len(regions)} regions")
+                response['regions'] = regions
+                # every region prefix holds its crop and the Textract result of the crop, like a page
+                for index, region in enumerate(regions):
+                    writer.put(key=f"{prefix}/pages/{page_num}/regions/{index}/textract-result/{page_num}.json",
+                               body=schema.with_blocks(region_blocks(schema.blocks, region['boundingBox'])).toBytes())
     return response
 
+def review_regions(scores, low_blocks) -> list:
+    '''
+    Review regions of a flagged page, or None when the page is better reviewed whole
+    '''
+    regions = plan_regions([scores.element(index) for index in low_blocks],
+                           padding=_region_padding, merge_gap=_region_merge_gap)
+    if not regions or len(regions) > _region_max_count or region_area(regions) > _region_max_area:
+        return None
+    return regions
+
+def list_output_parts(s3, prefix) -> list:
+    '''
+    Lists the job prefix once and returns the numbered Textract output parts in order,
+    skipping anything else under the prefix such as .s3_access_check or the pages/ folder
+    '''
+    parts = [key for key in s3.iter_objects(prefix=f"{prefix}/") if key[len(prefix) + 1:].isdigit()]
+    return sorted(parts, key=lambda key: int(key[len(prefix) + 1:]))
+
+def spool_output_part(s3, key) -> io.IOBase:
+    '''
+    Downloads an output part into a spooled temporary file so a prefetched part only
+    holds up to TEXTRACT_PREFETCH_SPOOL_MB of memory, the rest is written to /tmp
+    '''
+    spool = tempfile.SpooledTemporaryFile(max_size=_prefetch_spool_bytes)
+    try:
+        with contextlib.closing(s3.get_object_stream(key=key)) as body:
+            shutil.copyfileobj(body, spool, 1024 * 1024)
+        spool.seek(0)
+        return spool
+    except Exception as e:
+        spool.close()
+        raise e
+
+def open_output_parts(s3, keys, prefetch, stream=False) -> io.IOBase:
+    '''
+    Yields a readable body per output part. With prefetch the next parts are downloaded
+    on a thread pool while the current one is being processed, in streaming mode into
+    spooled temporary files so memory stays bounded when parts are large
+    '''
+    if not prefetch:
+        for key in keys:
+            with contextlib.closing(s3.get_object_stream(key=key)) as body:
+                yield body
+        return
+    if stream:
+        fetch = lambda key: spool_output_part(s3, key)
+    else:
+        fetch = lambda key: io.BytesIO(s3.get_object_content(key=key))
+    keys = iter(keys)
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        pending = deque((key, executor.submit(fetch, key)) for key in itertools.islice(keys, prefetch))
+        try:
+            while pending:
+                key, future = pending.popleft()
+                for next_key in itertools.islice(keys, 1):
+                    pending.append((next_key, executor.submit(fetch, next_key)))
+                logger.debug(f"Reading prefetched output part {key}")
+                with future.result() as body:
+                    yield body
+        finally:
+            # parts prefetched past an error or an early stop are released once downloaded
+            for _, future in pending:
+                if not future.cancel() and not future.exception():
+                    future.result().close()
+
+def read_output_parts(s3, prefix, stream, prefetch=0, keys=None) -> tuple:
+    '''
+    Reads the Textract output parts {prefix}/1, {prefix}/2, ... in order and yields
+    (key, value) pairs for each part, with every block in Blocks yielded individually.
+    In streaming mode blocks are parsed incrementally from the S3 body instead of
+    loading the whole output part into memory. keys limits the read to the given parts
+    '''
+    try:
+        if keys is None:
+            keys = list_output_parts(s3, prefix)
+        logger.info(f"Found {len(keys)} Textract output parts under {prefix}")
+        for body in open_output_parts(s3, keys, prefetch, stream):
+            if stream:
+                yield from JsonStream(body).iter_items('Blocks')
+            else:
+                textract_data = json.loads(body.read().decode())
+                yield from ((key, value) for key, value in textract_data.items() if key != 'Blocks')
+                yield from (('Blocks', block) for block in textract_data.get('Blocks'))
+    except Exception as e:
+        # the listing knows every part, a part that can't be read would silently drop the pages after it
+        logger.error(f"Unable to read the Textract output parts under {prefix}: {e}")
+        raise e
+
+def iter_pages(s3, prefix, stream, prefetch=0, keys=None, first_page=1, last_page=None) -> tuple:
+    '''
+    Groups the blocks of the Textract output by page and yields (header, page_num, blocks)
+    one page at a time. header holds the top level fields of the first output part read.
+    Only pages from first_page to last_page are yielded
+    '''
+    header = dict()
+    page_blocks = list()
+    page_num = 0
+    for key, value in read_output_parts(s3, prefix, stream, prefetch, keys):
+        if key != 'Blocks':
+            header.setdefault(key, value)
+            continue
+        if value.get('BlockType') == "PAGE":
+            '''
+            Start writing a new page
+            '''
+            if page_blocks:
+                yield header, page_num, page_blocks
+                page_blocks = list()
+            page_num = value.get('Page', 1)     #sync API response doesn't contain 'Page' so it will default to 1
+            if last_page and page_num > last_page:
+                return
+        if page_num >= first_page:
+            page_blocks.append(value)
+    # The last page
+    if page_blocks and page_num == (last_page or header.get('DocumentMetadata', {}).get('Pages')):
+        yield header, page_num, page_blocks
+
 def split_per_page(**kwargs) -> list[dict]:    
     doc_s3 = kwargs["doc_bucket"]
     doc = kwargs["document"]
@@ -140,90 +315,291 @@ def split_per_page(**kwargs) -> list[dict]:
         Initialize S3 client helper
         '''
         s3 = S3(bucket=bucket, log_level=log_level)        
-        ssm_resp = ssm.get_parameter(Name=_confidence_thresh_ssm)
-        confidence_threshold = float(ssm_resp['Parameter']['Value'])
-        page_blocks = list()
-        page_num = 0
-        output_counter = 1
-        main_schema = None
-        total_pages = None        
-        while True:
-            try:
-                textract_content = s3.get_object_content(key=f"{prefix}/{output_counter}")
-                textract_data = json.loads(textract_content.decode())
-                if not main_schema and not total_pages:
-                    main_schema = tManifest(textract_data)                
-                    total_pages = textract_data.get('DocumentMetadata').get('Pages')
-                output_counter = output_counter + 1
-                for block in textract_data.get('Blocks'):
-                    if block.get('BlockType') == "PAGE":
-                        '''
-                        Start writing a new page
-                        ''' 
-                        if page_blocks:                        
-                            main_schema.add_blocks(page_blocks)
-                            response = check_confidence(schema=main_schema, 
-                                                        threshold=confidence_threshold, 
-                                                        doc_s3=doc_s3, 
-                                                        doc=doc,                                                 
-                                                        bucket=bucket, 
-                                                        prefix=prefix, 
-                                                        job_id=job_id,
-                                                        page_num=page_num)                        
-                            if response:
-                                review_pages.append(response)                            
-                            page_blocks.clear()
-                        page_num = block.get('Page', 1)     #sync API response doesn't contain 'Page' so it will default to 1
-                        page_blocks.append(block)                                            
-                    else:
-                        page_blocks.append(block)
-            except Exception as e:
-                logger.error(e)
-                # no more files to read break and exit
-                break
-        # The last page
-        if page_blocks and page_num == total_pages:
-            main_schema.add_blocks(page_blocks)
-            response = check_confidence(schema=main_schema, 
-                                        threshold=confidence_threshold, 
-                                        doc_s3=doc_s3, 
-                                        doc=doc,                                                 
-                                        bucket=bucket, 
-                                        prefix=prefix, 
-                                        job_id=job_id,
-                                        page_num=page_num)                        
-            if response:
-                review_pages.append(response)                            
-            page_blocks.clear()
+        confidence_thresholds = get_thresholds()
+        with S3Writer(bucket=bucket, max_workers=_upload_workers, log_level=log_level) as writer:
+            for header, page_num, page_blocks in iter_pages(s3, prefix, _stream_output, _prefetch_parts,
+                                                            keys=kwargs.get('parts'),
+                                                            first_page=kwargs.get('first_page', 1),
+                                                            last_page=kwargs.get('last_page')):
+                main_schema = tManifest(header)
+                main_schema.add_blocks(page_blocks)
+                response = check_confidence(schema=main_schema, 
+                                            thresholds=confidence_thresholds, 
+                                            writer=writer, 
+                                            prefix=prefix, 
+                                            job_id=job_id,
+                                            page_num=page_num)                        
+                if response:
+                    review_pages.append(response)                            
+        if writer.failed:
+            raise Exception(f"Unable to write Textract page results {writer.failed}")
+        if review_pages:
+            '''
+            Split all flagged pages from the source document in one pass
+            '''
+            regions = {page['currPageNumber']: page.pop('regions') for page in review_pages if 'regions' in page}
+            pages = extract_pages(doc_s3=doc_s3, 
+                                  doc=doc,                                                 
+                                  bucket=bucket, 
+                                  prefix=prefix, 
+                                  page_nums=[page.get('currPageNumber') for page in review_pages],
+                                  regions=regions)
+            # task fields win, region tasks carry the confidence report of their region
+            review_pages = [{**page, **task} for page in review_pages for task in pages[page.get('currPageNumber')]]
         return review_pages
     except Exception as e:        
         logger.error(e)
         raise Exception(e)
 
-def send_to_gt(tasks) -> None:
-    sent_task = 0    
-    for task in tasks:
-        logger.info(f"Sending task to Ground Truth for {task.get('textractJobId')} page at {task.get('inputS3Prefix')}")
+def batch_tasks(tasks) -> list:
+    '''
+    Groups task messages into SNS publish_batch requests of at most 10 entries
+    and 256 KB in total
+    '''
+    batches = list()
+    batch, batch_size = list(), 0
+    for entry_id, task in enumerate(tasks):
+        message = json.dumps(task)
+        size = len(message.encode())
+        if batch and (len(batch) == SNS_BATCH_ENTRIES or batch_size + size > SNS_BATCH_BYTES):
+            batches.append(batch)
+            batch, batch_size = list(), 0
+        batch.append(({'Id': str(entry_id), 'Message': message}, task))
+        batch_size += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+def publish_batch(batch) -> list:
+    '''
+    Publishes one batch, retrying the entries that failed for a reason other than
+    the request itself. Returns the tasks that could not be delivered
+    '''
+    tasks = {entry['Id']: task for entry, task in batch}
+    entries = [entry for entry, _ in batch]
+    rejected = list()
+    for attempt in range(_publish_retries + 1):
+        if attempt:
+            time.sleep(0.1 * 2 ** attempt)
         try:
-            sns.publish(TopicArn=_gt_sns_topic, Message=json.dumps(task))    
-            sent_task = sent_task + 1
+            response = get_client('sns').publish_batch(TopicArn=_gt_sns_topic, PublishBatchRequestEntries=entries)
+            failed = response.get('Failed', [])
         except Exception as e:
             logger.error(e)
+            failed = [{'Id': entry['Id'], 'SenderFault': False, 'Message': str(e)} for entry in entries]
+        for failure in failed:
+            logger.error(f"Unable to send page {tasks[failure['Id']].get('currPageNumber')} to Ground Truth: {failure.get('Message')}")
+        # entries rejected because of the request itself are not retried
+        rejected.extend(failure['Id'] for failure in failed if failure.get('SenderFault'))
+        retry = {failure['Id'] for failure in failed if not failure.get('SenderFault')}
+        entries = [entry for entry in entries if entry['Id'] in retry]
+        if not entries:
+            break
+    return [tasks[entry_id] for entry_id in rejected + [entry['Id'] for entry in entries]]
+
+def publish_tasks(tasks) -> list:
+    '''
+    Publishes all tasks and returns the page numbers that could not be delivered
+    '''
+    logger.info(f"Sending {len(tasks)} tasks to Ground Truth for {tasks[0].get('textractJobId')}")
+    with ThreadPoolExecutor(max_workers=_publish_workers) as executor:
+        failed_tasks = list(itertools.chain.from_iterable(executor.map(publish_batch, batch_tasks(tasks))))
+    failed_pages = sorted(task.get('currPageNumber') for task in failed_tasks)
+    if failed_pages:
+        logger.error(f"Unable to send pages {failed_pages} to Ground Truth")
+    return failed_pages
+
+def start_tracking(job_id, pages_sent, failed_pages, workers=None) -> bool:
+    '''
+    Makes an entry to the tracking table. In fan-out mode the coordinator creates
+    the entry with the number of workers and the workers add their pages to it.
+    Returns False when the job already has an entry, other errors are raised
+    '''
+    ddb = get_client('dynamodb')
+    item = {'job_id': {'S': str(job_id)},
+            'pages_sent': {'N': str(pages_sent)},
+            'date_sent': {'N': str(int(time.time()))},
+            'pages_failed': {'L': [{'N': str(page)} for page in failed_pages]}}
+    if workers is not None:
+        item.update({'workers_pending': {'N': str(workers)}, 'pages_total': {'N': '0'}, 'range_claims': {'M': {}}})
     try:
-        # make an entry to the tracking table
-        job_id = tasks[0].get('textractJobId')
-        stmt = f"INSERT INTO \"{_tracking_table}\" VALUE {{'job_id' : ?, 'pages_sent' : ?, 'date_sent': ?}}"
-        logger.debug(stmt)
-        ddresponse = ddb.execute_statement(Statement=stmt, Parameters=[
-            {'S': str(job_id)},
-            {'N': str(sent_task)},
-            {'N': str(int(time.time()))}
-        ])
+        ddresponse = ddb.put_item(TableName=_tracking_table, Item=item, ConditionExpression="attribute_not_exists(job_id)")
         logger.debug(json.dumps(ddresponse))
-        logger.info(f"Sent {sent_task} pages to Ground Truth for review")
+        return True
+    except ddb.exceptions.ConditionalCheckFailedException:
+        logger.warning(f"Textract JobId {job_id} is already tracked")
+        return False
+    except Exception as e:
+        logger.error(f"Unable to track Textract JobId {job_id}: {e}")
+        raise e
+
+def send_to_gt(tasks) -> None:
+    failed_pages = publish_tasks(tasks)
+    sent_task = len(tasks) - len(failed_pages)
+    try:
+        start_tracking(tasks[0].get('textractJobId'), sent_task, failed_pages)
+    except Exception:
+        # the tasks are already with Ground Truth, the job is reviewed without completion tracking
+        pass
+    logger.info(f"Sent {sent_task} tasks to Ground Truth for review")
+
+def claim_work_item(job_id, range_id) -> bool:
+    '''
+    Claims a page range of a fan-out job in the tracking table for FANOUT_CLAIM_LEASE_SECONDS.
+    Returns False when the range is done or its claim is still held, e.g. by a duplicate
+    delivery of the same async invocation, so its tasks are not published twice. A retry
+    of a worker that timed out or ran out of memory finds the lease expired and claims it again
+    '''
+    ddb = get_client('dynamodb')
+    now = int(time.time())
+    try:
+        ddb.update_item(TableName=_tracking_table,
+                        Key={'job_id': {'S': str(job_id)}},
+                        UpdateExpression="SET range_claims.#range = :now",
+                        ConditionExpression="attribute_exists(job_id) AND NOT contains(ranges_done, :range_id) "
+                                            "AND (attribute_not_exists(range_claims.#range) OR range_claims.#range < :expired)",
+                        ExpressionAttributeNames={'#range': range_id},
+                        ExpressionAttributeValues={':now': {'N': str(now)},
+                                                   ':expired': {'N': str(now - _claim_lease)},
+                                                   ':range_id': {'S': range_id}})
+        return True
+    except ddb.exceptions.ConditionalCheckFailedException:
+        logger.warning(f"Pages {range_id} of Textract JobId {job_id} are done, claimed by another worker or the job is not tracked")
+        return False
+
+def finish_work_item(job_id, range_id, pages_sent, failed_pages) -> None:
+    '''
+    Adds the pages sent by a fan-out worker to the tracking table entry and marks the
+    worker done, once per page range. If every page of the job was already reviewed
+    by the time the last worker finishes, the completion notification is sent from here
+    '''
+    ddb = get_client('dynamodb')
+    sns = get_client('sns')
+    try:
+        response = ddb.update_item(TableName=_tracking_table,
+                                   Key={'job_id': {'S': str(job_id)}},
+                                   UpdateExpression="ADD pages_sent :sent, pages_total :sent, workers_pending :done, ranges_done :range "
+                                                    "SET pages_failed = list_append(if_not_exists(pages_failed, :empty), :failed)",
+                                   ConditionExpression="NOT contains(ranges_done, :range_id)",
+                                   ExpressionAttributeValues={':sent': {'N': str(pages_sent)},
+                                                              ':done': {'N': '-1'},
+                                                              ':range': {'SS': [range_id]},
+                                                              ':range_id': {'S': range_id},
+                                                              ':failed': {'L': [{'N': str(page)} for page in failed_pages]},
+                                                              ':empty': {'L': []}},
+                                   ReturnValues='ALL_NEW')
+        attributes = response['Attributes']
+        logger.debug(attributes)
+        if (int(attributes['workers_pending']['N']) == 0 and int(attributes['pages_sent']['N']) == 0
+                and int(attributes['pages_total']['N']) > 0 and _complete_sns_topic):
+            sns.publish(TopicArn=_complete_sns_topic,
+                        Message=f"Job {job_id} has completed reviewing all sent pages.",
+                        Subject="Job Complete")
+    except ddb.exceptions.ConditionalCheckFailedException:
+        logger.warning(f"Pages {range_id} of Textract JobId {job_id} were already counted")
     except Exception as e:
         logger.error(e)
 
+def process_work_item(item) -> dict:
+    '''
+    Fan-out worker, processes the pages of one page range of a Textract job
+    '''
+    range_id = f"{item['first_page']}-{item['last_page']}"
+    logger.info(f"Processing pages {range_id} of Textract JobId {item['textractJobId']}")
+    if not claim_work_item(item['textractJobId'], range_id):
+        return {'first_page': item['first_page'], 'last_page': item['last_page'], 'skipped': True}
+    try:
+        tasks = split_per_page(bucket=item['bucket'], 
+                               prefix=item['prefix'],
+                               doc_bucket=item['doc_bucket'],
+                               document=item['document'],
+                               textractJobId=item['textractJobId'],
+                               parts=item['parts'],
+                               first_page=item['first_page'],
+                               last_page=item['last_page'])
+        failed_pages = publish_tasks(tasks) if tasks else []
+    except Exception as e:
+        # the worker is still marked done so the job can complete, the range was never
+        # scored so every page of it is recorded as failed
+        logger.error(f"Unable to process pages {range_id}: {e}")
+        tasks, failed_pages = [], list(range(item['first_page'], item['last_page'] + 1))
+    pages_sent = len(tasks) - len(failed_pages) if tasks else 0
+    finish_work_item(item['textractJobId'], range_id, pages_sent, failed_pages)
+    return {'first_page': item['first_page'], 'last_page': item['last_page'],
+            'pages_sent': pages_sent, 'pages_failed': failed_pages}
+
+def fan_out(**kwargs) -> list:
+    '''
+    Fan-out coordinator, splits the job into page ranges and hands them to the workers.
+    Returns None when the job is small enough to be processed in this invocation
+    '''
+    function_name = kwargs.pop('function_name')
+    s3 = S3(bucket=kwargs['bucket'], log_level=log_level)
+    parts = part_boundaries(s3, list_output_parts(s3, kwargs['prefix']))
+    if not parts:
+        return None
+    total_pages = parts[0]['header'].get('DocumentMetadata', {}).get('Pages', 0)
+    items = plan_work_items(parts, total_pages, _fanout_pages)
+    if len(items) < 2:
+        return None
+    logger.info(f"Fanning out {total_pages} pages of Textract JobId {kwargs['textractJobId']} to {len(items)} workers")
+    if not start_tracking(kwargs['textractJobId'], 0, [], workers=len(items)):
+        # a duplicate delivery of the notification, the workers were already dispatched
+        logger.warning(f"Textract JobId {kwargs['textractJobId']} was already fanned out, skipping")
+        return []
+    for item in items:
+        item.update(kwargs)
+    if _fanout_executor == 'local':
+        executor = LocalExecutor(worker=process_work_item, log_level=log_level)
+    else:
+        executor = LambdaExecutor(function_name=function_name, log_level=log_level)
+    return executor.run(items)
+
+def process_record(record, output_bucket, output_prefix, function_name) -> dict:
+    '''
+    Processes the Textract job of one SNS record and reports the outcome. Errors are logged
+    and reported instead of raised so the other records of the event are not retried
+    '''
+    result = {'messageId': record.get('Sns', {}).get('MessageId'), 'jobId': None, 'status': 'failed'}
+    try:
+        '''
+        Grab details from the SNS Event notification
+        '''
+        message = json.loads(record['Sns']['Message'])
+        jobId = message['JobId']    
+        status= message['Status']
+        document_bucket = message['DocumentLocation']['S3Bucket']
+        document = message['DocumentLocation']['S3ObjectName']
+        result['jobId'] = jobId
+
+        if status != "SUCCEEDED":
+            logger.info(f"Textract Job {jobId} status is {status}. Skipping processing...")
+            result['status'] = 'skipped'
+            return result
+        if _fanout_pages:
+            workers = fan_out(bucket=output_bucket, 
+                              prefix=f"{output_prefix}{jobId}",
+                              doc_bucket=document_bucket,
+                              document=document,
+                              textractJobId=jobId,
+                              function_name=function_name)
+            if workers is not None:
+                logger.info(json.dumps(workers))
+                result.update(status='fanned_out' if workers else 'skipped', workers=len(workers))
+                return result
+        tasks = split_per_page(bucket=output_bucket, 
+                               prefix=f"{output_prefix}{jobId}",
+                               doc_bucket=document_bucket,
+                               document=document,
+                               textractJobId=jobId)
+        if tasks:
+            send_to_gt(tasks)
+        result.update(status='processed', tasks=len(tasks))
+    except Exception as e:
+        logger.error(f"Unable to process Textract job {result['jobId']}: {e}")
+        result['error'] = str(e)
+    return result
+
 def lambda_handler(event, context):        
     logger.setLevel(log_level)
     logger.info(json.dumps(event))
@@ -232,33 +608,29 @@ def lambda_handler(event, context):
         logger.error("A SageMaker Ground Truth SNS Topic for streaming job and confidence threshold SSM Parameter are required")
         raise Exception("A SageMaker Ground Truth SNS Topic and Confidence threshold are required")
 
+    '''
+    Fan-out worker invocation for a page range of a Textract job
+    '''
+    if 'fanout' in event:
+        return process_work_item(event['fanout'])
+
     '''
     location of the output bucket and prefix since SNS Notification
     Doesn't contian that info - https://docs.aws.amazon.com/textract/latest/dg/async-notification-payload.html
     '''
     output_bucket = os.environ.get('TEXTRACT_OUTPUT_BKT')
     output_prefix = f"{os.environ.get('TEXTRACT_OUTPUT_PREFIX').rstrip('/')}/" if os.environ.get('TEXTRACT_OUTPUT_PREFIX') else ""
+    function_name = context.invoked_function_arn if context else None
 
     '''
-    Grab details from the SNS Event notification
+    Every Textract job notification in the event is processed, independent jobs run concurrently
     '''
-    message = json.loads(event['Records'][0]['Sns']['Message'])
-    jobId = message['JobId']    
-    status= message['Status']
-    document_bucket = message['DocumentLocation']['S3Bucket']
-    document = message['DocumentLocation']['S3ObjectName']
-
-    if status != "SUCCEEDED":
-        logger.info(f"Textract Job status is {status}. Skipping processing...")
-        return
-    try:
-        tasks = split_per_page(bucket=output_bucket, 
-                               prefix=f"{output_prefix}{jobId}",
-                               doc_bucket=document_bucket,
-                               document=document,
-                               textractJobId=jobId)
-        if tasks:
-            send_to_gt(tasks)
-    except Exception as e:
-        logger.error(e)        
-    return event
+    records = event.get('Records', [])
+    if len(records) == 1:
+        results = [process_record(records[0], output_bucket, output_prefix, function_name)]
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, min(_record_workers, len(records)))) as executor:
+            results = list(executor.map(lambda record: process_record(record, output_bucket, output_prefix, function_name), records))
+    failed = [result for result in results if result['status'] == 'failed']
+    logger.info(f"Processed {len(records)} records, {len(failed)} failed: {json.dumps(results)}")
+    return {**event, 'results': results}
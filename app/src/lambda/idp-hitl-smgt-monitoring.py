@@ -1,14 +1,12 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import json
-import boto3
 import uuid
 import logging
 import os
+from Clients import get_client
 logger = logging.getLogger(__name__)
 
-client = boto3.client('sagemaker')
-
 '''
 Lambda code to check the Amazon SageMaker GroundTruth Labeling job status as well as create new job based on the Failed or Stopped Labelling job Status.
 This Lambda will be trigger by the Amazon EventBridge 
@@ -79,7 +77,7 @@ def lambda_handler(event, context):
 Get the latest job status
 '''   
 def get_labeling_job_status():
-    response = client.list_labeling_jobs(
+    response = get_client('sagemaker').list_labeling_jobs(
         NameContains=_job_name,
         SortBy='CreationTime',
         MaxResults=1,
@@ -93,7 +91,7 @@ Create new labeling job.
 '''
 def create_labeling_job():
     print(_tags)
-    response = client.create_labeling_job(
+    response = get_client('sagemaker').create_labeling_job(
         LabelingJobName=f"{_job_name}-{str(uuid.uuid4())}",
         LabelAttributeName='idp',
         InputConfig={'DataSource': {
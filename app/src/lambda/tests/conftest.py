@@ -0,0 +1,36 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import importlib.util
+import os
+import sys
+
+import pytest
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, LAMBDA_DIR)
+
+# moto never reaches AWS, the credentials only need to exist
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+
+def load_handler(name: str):
+    '''
+    Imports a Lambda handler module, their file names (idp-hitl-*.py) are not valid module names
+    '''
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(LAMBDA_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(autouse=True)
+def clients():
+    '''
+    Every test gets fresh shared clients, created inside its moto mock
+    '''
+    import Clients
+    Clients._clients.clear()
+    yield
+    Clients._clients.clear()
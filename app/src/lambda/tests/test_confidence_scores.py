@@ -0,0 +1,39 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+from ConfidenceScores import BLOCK_CODES, NO_CONFIDENCE, REVIEW_BLOCK_TYPES, BlockArrays, parse_thresholds
+
+
+@pytest.mark.parametrize('value, threshold', [('80', 80.0), ('80.', 80.0), ('.5', 0.5), (' 75.5 ', 75.5)])
+def test_single_threshold(value, threshold):
+    assert parse_thresholds(value) == {block_type: threshold for block_type in REVIEW_BLOCK_TYPES}
+
+
+def test_per_block_type_thresholds():
+    thresholds = parse_thresholds('{"default": 80, "KEY_VALUE_SET": 90, "SIGNATURE": null}')
+    assert thresholds['KEY_VALUE_SET'] == 90.0 and thresholds['WORD'] == 80.0
+    assert 'SIGNATURE' not in thresholds
+
+
+def test_unknown_block_type_is_rejected():
+    with pytest.raises(ValueError, match='KEY_VALUE'):
+        parse_thresholds('{"default": 80, "KEY_VALUE": 10}')
+
+
+@pytest.mark.parametrize('value', ['', 'eighty', '[80]'])
+def test_invalid_threshold_is_rejected(value):
+    with pytest.raises((ValueError, TypeError)):
+        parse_thresholds(value)
+
+
+def test_block_arrays_columns():
+    blocks = [{'Id': 'p1', 'BlockType': 'PAGE'},
+              {'Id': 'w1', 'BlockType': 'WORD', 'Confidence': 40.0},
+              {'Id': 'x1', 'BlockType': 'UNKNOWN', 'Confidence': 99.0}]
+    arrays = BlockArrays(blocks)
+    assert len(arrays) == 3
+    assert arrays.ids == ['p1', 'w1', 'x1']
+    assert list(arrays.types) == [BLOCK_CODES['PAGE'], BLOCK_CODES['WORD'], 0]
+    assert list(arrays.confidences) == [NO_CONFIDENCE, 40.0, 99.0]
+    assert arrays.low_confidence({'WORD': 80}) == [1]
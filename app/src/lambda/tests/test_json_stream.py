@@ -0,0 +1,32 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import io
+import json
+
+import pytest
+
+from JsonStream import JsonStream
+
+DOCUMENT = {'DocumentMetadata': {'Pages': 2}, 'Scores': [12.5, 3, -0.25e-3, 1E+2, 0, True, None, 'héllo', {'a': [1.5, False]}],
+            'Blocks': [{'Id': 'b1', 'Confidence': 99.87654, 'Text': 'h\u00e9llo \\"w\u00f6rld\\"'},
+                       {'Id': 'b2', 'Confidence': 1e-05, 'Geometry': {'Polygon': [{'X': 0.125, 'Y': 0.5}]}}],
+            'JobStatus': 'SUCCEEDED'}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 65536])
+@pytest.mark.parametrize('separators', [(',', ':'), (', ', ': ')])
+def test_iter_items_across_chunk_boundaries(chunk_size, separators):
+    body = io.BytesIO(json.dumps(DOCUMENT, ensure_ascii=False, separators=separators).encode())
+    items = list(JsonStream(body, chunk_size=chunk_size).iter_items('Blocks'))
+    assert [value for key, value in items if key == 'Blocks'] == DOCUMENT['Blocks']
+    assert {key: value for key, value in items if key != 'Blocks'} == {key: value for key, value in DOCUMENT.items() if key != 'Blocks'}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5])
+def test_iter_array_of_numbers(chunk_size):
+    assert list(JsonStream(io.BytesIO(b'[12.5, 3, 1e10,-7.0E-2]'), chunk_size=chunk_size).iter_array()) == [12.5, 3, 1e10, -7.0E-2]
+
+
+def test_truncated_document_raises():
+    with pytest.raises(ValueError):
+        list(JsonStream(io.BytesIO(b'[12.5, 3'), chunk_size=2).iter_array())
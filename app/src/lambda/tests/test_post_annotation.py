@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from conftest import load_handler
+
+TABLE = 'idp-hitl-tracking'
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    '''
+    Tracking table and the all pages complete topic, with a queue subscribed to count its messages
+    '''
+    from moto.dynamodb.models import DynamoDBBackend
+    # DynamoDB applies an update atomically, moto reads and writes the item without a lock
+    lock = threading.Lock()
+    update_item = DynamoDBBackend.update_item
+
+    def atomic_update_item(self, *args, **kwargs):
+        with lock:
+            return update_item(self, *args, **kwargs)
+    monkeypatch.setattr(DynamoDBBackend, 'update_item', atomic_update_item)
+    with mock_aws():
+        boto3.client('dynamodb').create_table(TableName=TABLE,
+                                              KeySchema=[{'AttributeName': 'job_id', 'KeyType': 'HASH'}],
+                                              AttributeDefinitions=[{'AttributeName': 'job_id', 'AttributeType': 'S'}],
+                                              BillingMode='PAY_PER_REQUEST')
+        sns = boto3.client('sns')
+        sqs = boto3.client('sqs')
+        topic_arn = sns.create_topic(Name='all-pages-complete')['TopicArn']
+        queue_url = sqs.create_queue(QueueName='all-pages-complete')['QueueUrl']
+        queue_arn = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['QueueArn'])['Attributes']['QueueArn']
+        sns.subscribe(TopicArn=topic_arn, Protocol='sqs', Endpoint=queue_arn)
+        yield {'topic_arn': topic_arn, 'queue_url': queue_url}
+
+
+@pytest.fixture
+def post_annotation(aws):
+    module = load_handler('idp-hitl-post-annotation')
+    module._tracking_table = TABLE
+    module._sns_topic_arn = aws['topic_arn']
+    return module
+
+
+def start_job(job_id, pages_sent, workers_pending=0):
+    boto3.client('dynamodb').put_item(TableName=TABLE, Item={'job_id': {'S': job_id},
+                                                             'pages_sent': {'N': str(pages_sent)},
+                                                             'workers_pending': {'N': str(workers_pending)}})
+
+
+def pages_left(job_id):
+    item = boto3.client('dynamodb').get_item(TableName=TABLE, Key={'job_id': {'S': job_id}})['Item']
+    return int(item['pages_sent']['N'])
+
+
+def completion_messages(queue_url):
+    sqs = boto3.client('sqs')
+    messages = list()
+    while True:
+        received = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get('Messages', [])
+        if not received:
+            return messages
+        messages.extend(json.loads(message['Body'])['Message'] for message in received)
+
+
+def review_concurrently(module, reviewed_pages, workers=10):
+    '''
+    Runs one decrement per batch on a thread pool and sends the completion notification
+    for every job a batch completed, the way lambda_handler does
+    '''
+    def review(batch):
+        completed = module.decrementPagesLeft(batch)
+        for job_id in completed:
+            module.sendSNSPagesComplete(job_id)
+        return completed
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [job_id for completed in executor.map(review, reviewed_pages) for job_id in completed]
+
+
+def test_concurrent_decrements_complete_job_once(aws, post_annotation):
+    start_job('job-1', 200)
+
+    completed = review_concurrently(post_annotation, [{'job-1': 1}] * 200)
+
+    assert pages_left('job-1') == 0
+    assert completed == ['job-1']
+    assert completion_messages(aws['queue_url']) == ["Job job-1 has completed reviewing all sent pages."]
+
+
+def test_batches_of_several_jobs(aws, post_annotation):
+    start_job('job-1', 30)
+    start_job('job-2', 45)
+
+    completed = review_concurrently(post_annotation, [{'job-1': 2, 'job-2': 3}] * 15)
+
+    assert pages_left('job-1') == 0 and pages_left('job-2') == 0
+    assert sorted(completed) == ['job-1', 'job-2']
+    assert len(completion_messages(aws['queue_url'])) == 2
+
+
+def test_fan_out_job_waits_for_workers(aws, post_annotation):
+    start_job('job-1', 10, workers_pending=1)
+
+    completed = review_concurrently(post_annotation, [{'job-1': 1}] * 10)
+
+    assert pages_left('job-1') == 0
+    assert completed == []
+    assert completion_messages(aws['queue_url']) == []
+
+
+def test_unknown_job_is_not_created(post_annotation):
+    assert post_annotation.decrementPagesLeft({'job-missing': 1}) == []
+    assert 'Item' not in boto3.client('dynamodb').get_item(TableName=TABLE, Key={'job_id': {'S': 'job-missing'}})
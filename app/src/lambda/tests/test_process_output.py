@@ -0,0 +1,275 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import io
+import json
+
+import pytest
+
+from conftest import load_handler
+
+PREFIX = 'output/job-1'
+
+
+def textract_parts(pages, parts):
+    '''
+    Textract output of pages single word pages split into parts output parts
+    '''
+    blocks = list()
+    for page in range(1, pages + 1):
+        blocks.append({'BlockType': 'PAGE', 'Id': f"p{page}", 'Page': page, 'Relationships': [{'Type': 'CHILD', 'Ids': [f"w{page}"]}]})
+        blocks.append({'BlockType': 'WORD', 'Id': f"w{page}", 'Page': page, 'Text': 'word', 'Confidence': 99.0 if page % 2 else 40.0,
+                       'Geometry': {'BoundingBox': {'Left': 0.1, 'Top': 0.1, 'Width': 0.2, 'Height': 0.05}}})
+    size = -(-len(blocks) // parts)
+    return {f"{PREFIX}/{part + 1}": json.dumps({'DocumentMetadata': {'Pages': pages}, 'JobStatus': 'SUCCEEDED',
+                                                'Blocks': blocks[part * size:(part + 1) * size]}).encode()
+            for part in range(parts)}
+
+
+class FakeS3:
+    def __init__(self, objects, broken=()):
+        self.objects = objects
+        self.broken = set(broken)
+
+    def iter_objects(self, prefix, filters=None, search=None):
+        return iter(sorted(key for key in self.objects if key.startswith(prefix)))
+
+    def get_object_content(self, key):
+        if key in self.broken:
+            raise Exception(f"Unable to read {key}")
+        return self.objects[key]
+
+    def get_object_stream(self, key):
+        return io.BytesIO(self.get_object_content(key))
+
+
+@pytest.fixture(scope='module')
+def process_output():
+    return load_handler('idp-hitl-process-output')
+
+
+@pytest.mark.parametrize('stream', [False, True])
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_iter_pages_yields_every_page(process_output, stream, prefetch):
+    s3 = FakeS3(textract_parts(pages=7, parts=3))
+    pages = [page_num for _, page_num, _ in process_output.iter_pages(s3, PREFIX, stream, prefetch)]
+    assert pages == list(range(1, 8))
+
+
+@pytest.mark.parametrize('stream', [False, True])
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_unreadable_part_fails_the_job(process_output, stream, prefetch):
+    s3 = FakeS3(textract_parts(pages=7, parts=3), broken=[f"{PREFIX}/2"])
+    with pytest.raises(Exception, match=f"{PREFIX}/2"):
+        list(process_output.iter_pages(s3, PREFIX, stream, prefetch))
+
+
+def test_streamed_prefetch_spills_to_disk(process_output, monkeypatch):
+    objects = textract_parts(pages=7, parts=3)
+    monkeypatch.setattr(process_output, '_prefetch_spool_bytes', 64)
+    rolled = list()
+    for body in process_output.open_output_parts(FakeS3(objects), sorted(objects), prefetch=2, stream=True):
+        # prefetched parts are not held in memory beyond the spool size
+        rolled.append(body._rolled)
+        assert json.loads(body.read())['DocumentMetadata'] == {'Pages': 7}
+    assert rolled == [True, True, True]
+
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_streamed_bodies_are_closed(process_output, prefetch):
+    objects = textract_parts(pages=7, parts=3)
+    bodies = list()
+    s3 = FakeS3(objects)
+    get_object_stream = s3.get_object_stream
+    s3.get_object_stream = lambda key: bodies.append(get_object_stream(key)) or bodies[-1]
+    parts = process_output.open_output_parts(s3, sorted(objects), prefetch=prefetch, stream=True)
+    body = next(parts)
+    assert not body.closed
+    # the reader stops early, e.g. after an error further down
+    parts.close()
+    assert body.closed and all(body.closed for body in bodies)
+
+@pytest.fixture
+def tracking_table(process_output, monkeypatch):
+    import boto3
+    from moto import mock_aws
+    with mock_aws():
+        ddb = boto3.client('dynamodb')
+        ddb.create_table(TableName='tracking', KeySchema=[{'AttributeName': 'job_id', 'KeyType': 'HASH'}],
+                         AttributeDefinitions=[{'AttributeName': 'job_id', 'AttributeType': 'S'}],
+                         BillingMode='PAY_PER_REQUEST')
+        monkeypatch.setattr(process_output, '_tracking_table', 'tracking')
+        monkeypatch.setattr(process_output, '_complete_sns_topic', None)
+        assert process_output.start_tracking('job-1', 0, [], workers=2)
+        yield lambda: ddb.get_item(TableName='tracking', Key={'job_id': {'S': 'job-1'}})['Item']
+
+
+def work_item(first_page, last_page):
+    return {'first_page': first_page, 'last_page': last_page, 'textractJobId': 'job-1', 'bucket': 'output',
+            'prefix': PREFIX, 'doc_bucket': 'input', 'document': 'doc.pdf', 'parts': [f"{PREFIX}/1"]}
+
+
+def test_failed_range_is_recorded(process_output, tracking_table, monkeypatch):
+    def fail(**kwargs):
+        raise Exception("Unable to read the Textract output parts")
+    monkeypatch.setattr(process_output, 'split_per_page', fail)
+
+    result = process_output.process_work_item(work_item(6, 8))
+
+    item = tracking_table()
+    assert result['pages_failed'] == [6, 7, 8]
+    assert [int(page['N']) for page in item['pages_failed']['L']] == [6, 7, 8]
+    assert item['workers_pending']['N'] == '1'
+
+
+def test_duplicate_range_is_processed_once(process_output, tracking_table, monkeypatch):
+    published = list()
+    monkeypatch.setattr(process_output, 'split_per_page', lambda **kwargs: [{'currPageNumber': 2, 'textractJobId': 'job-1'}])
+    monkeypatch.setattr(process_output, 'publish_tasks', lambda tasks: published.extend(tasks) or [])
+
+    first = process_output.process_work_item(work_item(1, 5))
+    again = process_output.process_work_item(work_item(1, 5))
+
+    item = tracking_table()
+    assert first['pages_sent'] == 1 and again.get('skipped')
+    assert len(published) == 1
+    assert item['pages_sent']['N'] == '1' and item['workers_pending']['N'] == '1'
+
+
+@pytest.mark.parametrize('variable, value', [('PAGE_RESULT_WRITE_POLICY', 'none'), ('PAGE_RESULT_WRITE_POLICY', 'flaged'),
+                                             ('PAGE_RENDITION_FORMAT', 'png')])
+def test_unknown_setting_is_rejected(monkeypatch, variable, value):
+    monkeypatch.setenv(variable, value)
+    with pytest.raises(Exception, match=variable):
+        load_handler('idp-hitl-process-output')
+
+
+@pytest.fixture
+def fan_out_job(process_output, monkeypatch):
+    '''
+    A job planned into three page ranges, processed by in process workers that record their ranges
+    '''
+    parts = [{'key': f"{PREFIX}/{part}", 'header': {'DocumentMetadata': {'Pages': 15}}, 'first_page': first_page,
+              'starts_with_page': True} for part, first_page in [(1, 1), (2, 6), (3, 11)]]
+    monkeypatch.setattr(process_output, 'list_output_parts', lambda s3, prefix: [part['key'] for part in parts])
+    monkeypatch.setattr(process_output, 'part_boundaries', lambda s3, keys: parts)
+    monkeypatch.setattr(process_output, '_fanout_pages', 5)
+    monkeypatch.setattr(process_output, '_fanout_executor', 'local')
+    processed = list()
+    monkeypatch.setattr(process_output, 'process_work_item', lambda item: processed.append(item['first_page']) or item)
+    return processed
+
+
+def fan_out_record(process_output):
+    record = {'Sns': {'MessageId': 'message-1',
+                      'Message': json.dumps({'JobId': 'job-2', 'Status': 'SUCCEEDED',
+                                             'DocumentLocation': {'S3Bucket': 'input', 'S3ObjectName': 'doc.pdf'}})}}
+    return process_output.process_record(record, 'output', 'output/', None)
+
+
+def test_fan_out_creates_tracking_entry(process_output, tracking_table, fan_out_job):
+    result = fan_out_record(process_output)
+
+    assert result['status'] == 'fanned_out' and sorted(fan_out_job) == [1, 6, 11]
+
+
+def test_duplicate_notification_is_not_fanned_out_again(process_output, tracking_table, fan_out_job):
+    fan_out_record(process_output)
+    result = fan_out_record(process_output)
+
+    assert result['status'] == 'skipped'
+    assert sorted(fan_out_job) == [1, 6, 11]
+
+
+def test_untracked_fan_out_fails_the_record(process_output, tracking_table, fan_out_job, monkeypatch):
+    monkeypatch.setattr(process_output, '_tracking_table', 'missing-table')
+
+    result = fan_out_record(process_output)
+
+    assert result['status'] == 'failed'
+    assert fan_out_job == []
+
+
+def test_expired_claim_is_claimed_again(process_output, tracking_table, monkeypatch):
+    # a worker that timed out holds its claim until the lease expires, then a retry takes over
+    assert process_output.claim_work_item('job-1', '1-5')
+    assert not process_output.claim_work_item('job-1', '1-5')
+    monkeypatch.setattr(process_output, '_claim_lease', -1)
+    assert process_output.claim_work_item('job-1', '1-5')
+
+    process_output.finish_work_item('job-1', '1-5', 2, [])
+    assert not process_output.claim_work_item('job-1', '1-5')
+    assert tracking_table()['workers_pending']['N'] == '1'
+
+
+class FakeSNS:
+    '''
+    SNS client stub, faults lists per entry id what each attempt returns: 'sender' and
+    'transient' fail the entry with SenderFault true and false, None delivers it.
+    raises is the number of requests failing as a whole before the service recovers
+    '''
+    def __init__(self, faults=None, raises=0):
+        self.faults = faults or dict()
+        self.raises = raises
+        self.attempts = dict()
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        for entry in PublishBatchRequestEntries:
+            self.attempts[entry['Id']] = self.attempts.get(entry['Id'], 0) + 1
+        if self.raises:
+            self.raises -= 1
+            raise Exception('Service unavailable')
+        failed = list()
+        for entry in PublishBatchRequestEntries:
+            # the last fault listed repeats on later attempts
+            faults = self.faults.get(entry['Id'], [None])
+            fault = faults[min(self.attempts[entry['Id']], len(faults)) - 1]
+            if fault:
+                failed.append({'Id': entry['Id'], 'SenderFault': fault == 'sender', 'Code': fault, 'Message': fault})
+        return {'Successful': [], 'Failed': failed}
+
+
+def gt_tasks(pages, job_id='job-2'):
+    return [{'textractJobId': job_id, 'currPageNumber': page} for page in range(1, pages + 1)]
+
+
+@pytest.fixture
+def sns(process_output, monkeypatch):
+    import Clients
+    monkeypatch.setattr(process_output, '_publish_retries', 2)
+    monkeypatch.setattr(process_output.time, 'sleep', lambda seconds: None)
+
+    def stub(**kwargs):
+        Clients._clients['sns'] = FakeSNS(**kwargs)
+        return Clients._clients['sns']
+    return stub
+
+
+def test_partially_failed_batch_is_retried(process_output, sns):
+    # entry ids are the task index, page 1 is entry '0'
+    client = sns(faults={'1': ['sender'], '2': ['transient', None], '3': ['transient'], '11': ['transient', None]})
+    assert process_output.publish_tasks(gt_tasks(12)) == [2, 4]
+    # sender faults are not retried, other failures until they succeed or the retries run out
+    assert client.attempts['1'] == 1
+    assert client.attempts['2'] == 2 and client.attempts['11'] == 2
+    assert client.attempts['3'] == 3
+    assert client.attempts['0'] == 1
+
+
+def test_failed_request_is_retried(process_output, sns):
+    client = sns(raises=1)
+    assert process_output.publish_tasks(gt_tasks(3)) == []
+    assert client.attempts == {'0': 2, '1': 2, '2': 2}
+
+
+def test_failed_request_fails_every_page(process_output, sns):
+    sns(raises=3)
+    assert process_output.publish_tasks(gt_tasks(3)) == [1, 2, 3]
+
+
+def test_sent_and_failed_pages_are_tracked(process_output, tracking_table, sns):
+    sns(faults={'0': ['sender'], '4': ['transient']})
+    process_output.send_to_gt(gt_tasks(5))
+    item = process_output.get_client('dynamodb').get_item(TableName='tracking', Key={'job_id': {'S': 'job-2'}})['Item']
+    assert item['pages_sent'] == {'N': '3'}
+    assert item['pages_failed'] == {'L': [{'N': '1'}, {'N': '5'}]}
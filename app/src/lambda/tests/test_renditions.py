@@ -0,0 +1,71 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+from pypdf import PdfReader, PdfWriter
+
+from DocumentCache import PDF_MIME
+from RegionCrops import crop_region
+from Renditions import page_image
+
+
+class PdfDocument:
+    '''
+    The part of DocumentCache.SourceDocument page_image uses
+    '''
+    mime = PDF_MIME
+
+    def __init__(self, data):
+        self.reader = PdfReader(io.BytesIO(data))
+
+    def pdf_page(self, page_num):
+        return self.reader.pages[page_num - 1]
+
+
+def scanned_pdf(rotation=0, images=1, page_size=None):
+    '''
+    Letter size scan at 100 dpi with a black mark in the top left corner of the scanned sheet
+    '''
+    scan = Image.new('L', (850, 1100), 255)
+    ImageDraw.Draw(scan).rectangle((50, 50, 250, 150), fill=0)
+    out = io.BytesIO()
+    scan.save(out, format='PDF', resolution=100)
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(out.getvalue())))
+    page = writer.pages[0]
+    if page_size:
+        page.mediabox.upper_right = page_size
+    if images > 1:
+        # a second, smaller image drawn on the same page
+        stamp = io.BytesIO()
+        Image.new('L', (100, 100), 0).save(stamp, format='PDF', resolution=100)
+        page.merge_page(PdfReader(io.BytesIO(stamp.getvalue())).pages[0])
+    if rotation:
+        page.rotate(rotation)
+    out = io.BytesIO()
+    writer.write(out)
+    return PdfDocument(out.getvalue())
+
+
+def test_scanned_page():
+    img, dpi = page_image(scanned_pdf(), 1, None)
+    assert img.size == (850, 1100) and dpi == pytest.approx(100)
+    mark = crop_region(img, {'Left': 50 / 850, 'Top': 50 / 1100, 'Width': 200 / 850, 'Height': 100 / 1100})
+    # the scan is JPEG compressed in the PDF
+    assert mark.getextrema()[1] < 64
+
+
+def test_rotated_page_is_imaged_as_displayed():
+    img, dpi = page_image(scanned_pdf(rotation=90), 1, None)
+    assert img.size == (1100, 850) and dpi == pytest.approx(100)
+    # turned clockwise, the mark is now in the top right corner of the displayed page
+    mark = crop_region(img, {'Left': 950 / 1100, 'Top': 50 / 850, 'Width': 100 / 1100, 'Height': 200 / 850})
+    assert mark.getextrema()[1] < 64
+    unrotated = crop_region(img, {'Left': 50 / 1100, 'Top': 50 / 850, 'Width': 200 / 1100, 'Height': 100 / 850})
+    assert unrotated.getextrema()[0] > 192
+
+
+@pytest.mark.parametrize('document', [lambda: scanned_pdf(images=2), lambda: scanned_pdf(page_size=(612, 612))])
+def test_page_not_covered_by_one_image_has_no_image(document):
+    assert page_image(document(), 1, None) == (None, None)
@@ -0,0 +1,89 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+import S3Functions
+from S3Functions import S3
+
+BUCKET = 'bkt-test'
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    import boto3
+    from moto import mock_aws
+    # small batches so the deletes run while the listing is paged through
+    monkeypatch.setattr(S3Functions, 'DELETE_BATCH_SIZE', 2)
+    with mock_aws():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket=BUCKET)
+        for index in range(5):
+            client.put_object(Bucket=BUCKET, Key=f"src/doc-{index}.json", Body=b'{}')
+        client.put_object(Bucket=BUCKET, Key='src/doc-0.png', Body=b'png')
+        yield lambda prefix: sorted(obj['Key'] for obj in client.list_objects_v2(Bucket=BUCKET, Prefix=prefix).get('Contents', []))
+
+
+def fail_copies(s3, monkeypatch, keys):
+    server_copy = s3._server_copy
+
+    def copy(source_object, destination_object, size):
+        if source_object in keys:
+            raise Exception('AccessDenied')
+        server_copy(source_object, destination_object, size)
+    monkeypatch.setattr(s3, '_server_copy', copy)
+
+
+def fail_deletes(s3, monkeypatch, keys):
+    delete_objects = s3.client.delete_objects
+
+    def delete(Bucket, Delete):
+        objects = [obj for obj in Delete['Objects'] if obj['Key'] not in keys]
+        response = delete_objects(Bucket=Bucket, Delete={'Objects': objects}) if objects else {}
+        errors = [{'Key': obj['Key'], 'Code': 'AccessDenied', 'Message': 'Access Denied'}
+                  for obj in Delete['Objects'] if obj['Key'] in keys]
+        return {**response, 'Errors': response.get('Errors', []) + errors}
+    monkeypatch.setattr(s3.client, 'delete_objects', delete)
+
+
+def test_copy_objects_reports_failed_copies(bucket, monkeypatch):
+    s3 = S3(BUCKET)
+    fail_copies(s3, monkeypatch, {'src/doc-1.json'})
+    result = s3.copy_objects('src/', 'dst/', search=['.json'])
+    assert not result
+    assert result.total == 5
+    assert sorted(result.copied) == ['src/doc-0.json', 'src/doc-2.json', 'src/doc-3.json', 'src/doc-4.json']
+    assert list(result.failed) == ['src/doc-1.json'] and 'AccessDenied' in result.failed['src/doc-1.json']
+    assert result.deleted == []
+    assert bucket('dst/') == ['dst/doc-0.json', 'dst/doc-2.json', 'dst/doc-3.json', 'dst/doc-4.json']
+    assert len(bucket('src/')) == 6
+
+
+def test_move_objects_keeps_sources_not_copied_or_deleted(bucket, monkeypatch):
+    s3 = S3(BUCKET)
+    fail_copies(s3, monkeypatch, {'src/doc-1.json'})
+    fail_deletes(s3, monkeypatch, {'src/doc-3.json'})
+    result = s3.move_objects('src/', 'dst/', search=['.json'])
+    assert not result
+    assert result.total == 5 and len(result.copied) == 4
+    assert sorted(result.deleted) == ['src/doc-0.json', 'src/doc-2.json', 'src/doc-4.json']
+    assert sorted(result.failed) == ['src/doc-1.json', 'src/doc-3.json']
+    assert result.failed['src/doc-3.json'] == 'AccessDenied: Access Denied'
+    # the failed copy is never deleted, the failed delete is left in place
+    assert bucket('src/') == ['src/doc-0.png', 'src/doc-1.json', 'src/doc-3.json']
+    assert len(bucket('dst/')) == 4
+
+
+def test_move_objects(bucket):
+    result = S3(BUCKET).move_objects('src/', 'dst/')
+    assert result
+    assert result.total == 6 and len(result.copied) == 6 and len(result.deleted) == 6
+    assert bucket('src/') == []
+
+
+def test_delete_prefix_combines_batches(bucket, monkeypatch):
+    s3 = S3(BUCKET)
+    fail_deletes(s3, monkeypatch, {'src/doc-2.json'})
+    result = s3.delete_prefix('src/', filters=['.png'])
+    assert sorted(item['Key'] for item in result['Deleted']) == ['src/doc-0.json', 'src/doc-1.json', 'src/doc-3.json', 'src/doc-4.json']
+    assert [error['Key'] for error in result['Errors']] == ['src/doc-2.json']
+    assert bucket('src/') == ['src/doc-0.png', 'src/doc-2.json']